@@ -0,0 +1,8 @@
+// Computes RAM[0] = 2 + 3
+
+@2
+D=A
+@3
+D=D+A
+@0
+M=D
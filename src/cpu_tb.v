@@ -2,17 +2,32 @@
 `timescale 1ns/1ps
 
 module cpu_tb (
+`ifdef HDL_CLOCK
+    output reg clk,
+`else
     input   clk,
+`endif
     input   cpu_reset,
     input   mem_reset
 );
 
+`ifdef CLOCK_HZ
+    localparam CLOCK_HZ = `CLOCK_HZ;
+`else
+    localparam CLOCK_HZ = 6250;
+`endif
+
     initial begin
         $dumpfile ("cpu_tb.vcd");
         $dumpvars (0, cpu_tb);
         #1;
     end
 
+`ifdef HDL_CLOCK
+`define HDL_CLOCK_DEFAULT_HZ CLOCK_HZ
+`include "hdl_clock.vh"
+`endif
+
     CPU cpu (
         .clk(clk),
         .reset(cpu_reset),
@@ -56,4 +71,39 @@ module cpu_tb (
         .data_o(instruction)
     );
 
+    // Bulk access to the memories through hex files ($readmemh format).
+    // The file names come from +ROM_HEX, +RAM_HEX and +RAM_DUMP, and the
+    // memories are loaded from them at time zero. The names can also be
+    // deposited into the registers below, and the files are read (or
+    // written) again whenever the matching trigger register toggles.
+    reg [8*1024-1:0] rom_hex;
+    reg [8*1024-1:0] ram_hex;
+    reg [8*1024-1:0] ram_dump;
+    reg load_rom;
+    reg load_ram;
+    reg dump_ram;
+
+    initial begin
+        rom_hex = 0;
+        ram_hex = 0;
+        ram_dump = 0;
+        load_rom = 1'b0;
+        load_ram = 1'b0;
+        dump_ram = 1'b0;
+
+        if ($value$plusargs("ROM_HEX=%s", rom_hex)) begin
+            $readmemh(rom_hex, rom.memory);
+        end
+        if ($value$plusargs("RAM_HEX=%s", ram_hex)) begin
+            $readmemh(ram_hex, ram.memory);
+        end
+        if (!$value$plusargs("RAM_DUMP=%s", ram_dump)) begin
+            ram_dump = 0;
+        end
+    end
+
+    always @(load_rom) if (rom_hex != 0) $readmemh(rom_hex, rom.memory);
+    always @(load_ram) if (ram_hex != 0) $readmemh(ram_hex, ram.memory);
+    always @(dump_ram) if (ram_dump != 0) $writememh(ram_dump, ram.memory);
+
 endmodule
@@ -0,0 +1,103 @@
+// Computes RAM[13]/RAM[14] and stores the result in RAM[15].
+// The remainder is discarded.
+// It is assumed that both numbers are > 0.
+
+@MAIN
+0;JMP
+
+// Divides remainder by divisor, and stores the quotient in result.
+// Returns to the address in return.
+(DIVIDE)
+@divisor
+D=M
+@shifted
+M=D
+
+// Shift the divisor left until it's larger than the dividend
+(SHIFT_LOOP)
+@shifted
+D=M
+@remainder
+D=D-M
+@SHIFT_DONE
+D;JGT
+@shifted
+M=M<<
+@SHIFT_LOOP
+0;JMP
+
+// Undo the last shift
+(SHIFT_DONE)
+@32767
+D=A
+@shifted
+M=M>>
+M=D&M
+
+@quotient
+M=0
+
+// Long division, one bit at a time
+(DIVIDE_LOOP)
+@shifted
+D=M
+@divisor
+D=D-M
+@DIVIDE_END
+D;JLT
+
+@quotient
+M=M<<
+
+@remainder
+D=M
+@shifted
+D=D-M
+@NEXT_BIT
+D;JLT
+
+@quotient
+M=M+1
+@remainder
+D=M
+@shifted
+D=D-M
+@remainder
+M=D
+
+(NEXT_BIT)
+@shifted
+M=M>>
+@DIVIDE_LOOP
+0;JMP
+
+(DIVIDE_END)
+@quotient
+D=M
+@result
+M=D
+@return
+A=M
+0;JMP
+
+(MAIN)
+@R13
+D=M
+@remainder
+M=D
+@R14
+D=M
+@divisor
+M=D
+@RETURN
+D=A
+@return
+M=D
+@DIVIDE
+0;JMP
+
+(RETURN)
+@result
+D=M
+@R15
+M=D
@@ -0,0 +1,480 @@
+"""
+Reference model of the extended Hack CPU (see cpu.v and extend_alu.v).
+
+Words are kept as unsigned 16-bit integers internally. Use `to_signed`
+to convert them to the representation returned by the testbenches.
+"""
+
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+WORD_BITS = 16
+WORD_MASK = (1 << WORD_BITS) - 1
+SIGN_BIT = 1 << (WORD_BITS - 1)
+
+ADDRESS_MASK = 0x7FFF
+
+# Memory sizes of cpu_tb
+ROM_WORDS = 32 * 1024
+RAM_WORDS = 16 * 1024
+
+
+def to_signed(word: int) -> int:
+    """
+    Interprets a 16-bit word as a two's complement number.
+    """
+    word &= WORD_MASK
+    return word - (1 << WORD_BITS) if word & SIGN_BIT else word
+
+
+def alu(x: int, y: int, instruction: int) -> int:
+    """
+    Computes the output of the ExtendALU module for the given 9-bit instruction.
+
+    Inputs and output are unsigned 16-bit words.
+    """
+
+    extended = (instruction >> 7) & 0b11
+
+    if extended == 0b11:
+        if instruction & 0b100000:  # zx
+            x = 0
+        if instruction & 0b010000:  # nx
+            x = ~x & WORD_MASK
+        if instruction & 0b001000:  # zy
+            y = 0
+        if instruction & 0b000100:  # ny
+            y = ~y & WORD_MASK
+
+        if instruction & 0b000010:  # f
+            result = (x + y) & WORD_MASK
+        else:
+            result = x & y
+
+        if instruction & 0b000001:  # no
+            result = ~result & WORD_MASK
+
+        return result
+
+    if extended == 0b01:
+        operand = x if instruction & 0b010000 else y
+        if instruction & 0b100000:
+            return (operand << 1) & WORD_MASK
+        # Arithmetic shift, the sign bit is preserved
+        return (operand >> 1) | (operand & SIGN_BIT)
+
+    return x ^ y
+
+
+def load_hack(path: str) -> List[int]:
+    """
+    Loads a program from a .hack file, with one binary-encoded instruction
+    per line.
+    """
+    with open(path, mode="r", encoding="ASCII") as f:
+        return [int(line, 2) for line in f if line.strip()]
+
+
+def halt_addresses(program: Sequence[int]) -> FrozenSet[int]:
+    """
+    Finds the addresses at which the program is stuck for good.
+
+    These are the A instructions of terminal loops such as `@14; 0;JMP`
+    at addresses 14-15 (or `@15; 0;JMP`, which only loops on the jump),
+    and the address right after the last instruction. The rest of the ROM
+    is expected to be zero, so past the end the CPU only loads A until
+    the PC wraps around.
+
+    Once the PC reaches one of these addresses, neither RAM nor the D register
+    change anymore.
+    """
+
+    halts = {len(program)}
+
+    for address in range(1, len(program)):
+        load = int(program[address - 1])
+        jump = int(program[address])
+
+        if load & 0x8000 or load not in (address - 1, address):
+            continue
+
+        # An unconditional jump, without any destination
+        if jump & 0x8000 and jump & 0b111111 == 0b000111:
+            halts.add(address - 1)
+
+    return frozenset(halts)
+
+
+def alu_instruction(instruction: int) -> int:
+    """
+    Extracts the ExtendALU instruction from a CPU instruction.
+
+    Bits 13-14 of the CPU instruction map to bits 7-8 of the ALU instruction,
+    and the 'comp' bits map to bits 0-5.
+    """
+    return ((instruction >> 6) & 0b111111) | (((instruction >> 13) & 0b11) << 7)
+
+
+class CpuOutputs(NamedTuple):
+    """
+    Combinational outputs of the CPU module.
+    """
+
+    next_instruction_addr: int
+    memory_addr: int
+    memory_we: bool
+    memory_out: int
+
+
+class Cpu:
+    """
+    Cycle-accurate model of the CPU module, connected to a ROM and a RAM.
+
+    Each call to `step` corresponds to a single rising clock edge
+    with reset deasserted.
+
+    `halts` holds the addresses at which the program is considered halted,
+    see `halt_addresses`.
+
+    The ROM and RAM sizes must be powers of two. Addresses wrap around
+    the same way they do in hardware, where only the low address bits
+    are connected to the memories.
+    """
+
+    def __init__(
+        self,
+        program: Sequence[int],
+        memory: Optional[Mapping[int, int]] = None,
+        rom_words: int = ROM_WORDS,
+        ram_words: int = RAM_WORDS,
+    ):
+        assert rom_words & (rom_words - 1) == 0
+        assert ram_words & (ram_words - 1) == 0
+        assert len(program) <= rom_words
+
+        self.rom = [int(instruction) & WORD_MASK for instruction in program]
+        self.rom.extend([0] * (rom_words - len(self.rom)))
+
+        self.ram = [0] * ram_words
+        if memory:
+            for address, value in memory.items():
+                self.ram[address] = value & WORD_MASK
+
+        self._rom_mask = rom_words - 1
+        self._ram_mask = ram_words - 1
+
+        self.halts = halt_addresses(program)
+
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+
+    def reset(self):
+        """
+        Resets the CPU registers. Memory contents are retained.
+        """
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+
+    @property
+    def instruction(self) -> int:
+        """
+        The instruction currently presented to the CPU.
+        """
+        return self.rom[self.pc & self._rom_mask]
+
+    def outputs(self) -> CpuOutputs:
+        """
+        Returns the outputs of the CPU module in the current state,
+        before the next instruction executes.
+        """
+
+        instruction = self.rom[self.pc & self._rom_mask]
+
+        # The ALU is wired up even for A instructions
+        y = self.ram[self.a & self._ram_mask] if instruction & 0x1000 else self.a
+
+        return CpuOutputs(
+            next_instruction_addr=self.pc,
+            memory_addr=self.a & ADDRESS_MASK,
+            memory_we=bool(instruction & 0x8000 and instruction & 0b001000),
+            memory_out=alu(self.d, y, alu_instruction(instruction)),
+        )
+
+    def step(self):
+        """
+        Executes a single instruction.
+        """
+
+        instruction = self.rom[self.pc & self._rom_mask]
+
+        self.cycles += 1
+
+        if not instruction & 0x8000:
+            self.a = instruction
+            self.pc = (self.pc + 1) & ADDRESS_MASK
+            return
+
+        address = self.a & self._ram_mask
+        y = self.ram[address] if instruction & 0x1000 else self.a
+        result = alu(self.d, y, alu_instruction(instruction))
+
+        if instruction & 0b001000:
+            self.ram[address] = result
+
+        if _jump_taken(instruction, result):
+            self.pc = self.a & ADDRESS_MASK
+        else:
+            self.pc = (self.pc + 1) & ADDRESS_MASK
+
+        if instruction & 0b100000:
+            self.a = result
+        if instruction & 0b010000:
+            self.d = result
+
+    @property
+    def halted(self) -> bool:
+        """
+        Whether the program has reached one of its halt addresses.
+        """
+        return self.pc in self.halts
+
+    def run(self, cycles: int):
+        """
+        Executes the given number of instructions.
+        """
+        for _ in range(cycles):
+            self.step()
+
+    def run_until_halt(self, max_cycles: int) -> bool:
+        """
+        Executes instructions until the program halts, but no more than
+        `max_cycles` of them. Returns whether the program halted.
+        """
+        for _ in range(max_cycles):
+            if self.pc in self.halts:
+                return True
+            self.step()
+        return self.halted
+
+    def signed_memory(self) -> List[int]:
+        """
+        Returns the RAM contents as signed numbers.
+        """
+        return [to_signed(word) for word in self.ram]
+
+
+# A translated basic block. Takes the A and D registers and the RAM,
+# and returns the new A and D registers and the next PC.
+_Block = Callable[[int, int, List[int]], Tuple[int, int, int]]
+
+
+class TranslatingCpu(Cpu):
+    """
+    A `Cpu` that translates basic blocks into Python functions.
+
+    A block starts at any address the program counter reaches and extends up
+    to and including the first jump instruction. Blocks also end before
+    halt addresses, so that halting is detected exactly. Each block is
+    translated once, on first entry, and afterwards executes without decoding
+    any instructions.
+
+    Execution is still exact to the cycle: if fewer cycles remain than there
+    are instructions in the next block, the remainder is interpreted.
+    """
+
+    # Upper bound on the number of C instructions in a single block.
+    MAX_BLOCK_COMPUTATIONS = 64
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._blocks: Dict[int, Tuple[int, _Block]] = {}
+
+    def run(self, cycles: int):
+        self._run_blocks(cycles, stop_at_halt=False)
+
+    def run_until_halt(self, max_cycles: int) -> bool:
+        self._run_blocks(max_cycles, stop_at_halt=True)
+        return self.halted
+
+    def _run_blocks(self, cycles: int, stop_at_halt: bool):
+        remaining = cycles
+
+        while remaining > 0:
+            pc = self.pc
+
+            if stop_at_halt and pc in self.halts:
+                return
+
+            try:
+                length, block = self._blocks[pc]
+            except KeyError:
+                length, block = self._blocks[pc] = self._translate(pc)
+
+            if length > remaining:
+                break
+
+            self.a, self.d, self.pc = block(self.a, self.d, self.ram)
+            self.cycles += length
+            remaining -= length
+
+        if stop_at_halt:
+            super().run_until_halt(remaining)
+        else:
+            super().run(remaining)
+
+    def _translate(self, start: int) -> Tuple[int, _Block]:
+        lines = ["def block(a, d, ram):"]
+
+        # Only the last of several consecutive A instructions is observable,
+        # so runs of them (such as the zero-filled ROM tail) collapse into
+        # a single assignment.
+        pending_a = None
+
+        length = 0
+        computations = 0
+        pc = start
+        while True:
+            instruction = self.rom[pc & self._rom_mask]
+            pc = (pc + 1) & ADDRESS_MASK
+            length += 1
+
+            if instruction & 0x8000:
+                if pending_a is not None:
+                    lines.append(f"    a = {pending_a}")
+                    pending_a = None
+
+                lines.extend(
+                    f"    {line}"
+                    for line in _translate_instruction(instruction, self._ram_mask)
+                )
+
+                computations += 1
+                if instruction & 0b111 or computations == self.MAX_BLOCK_COMPUTATIONS:
+                    break
+            else:
+                pending_a = instruction
+
+            # Don't let a block wrap around the address space
+            if pc == 0 or pc in self.halts:
+                break
+
+        if pending_a is not None:
+            lines.append(f"    a = {pending_a}")
+
+        lines.append(f"    return a, d, {pc}")
+
+        namespace: dict = {}
+        exec("\n".join(lines), namespace)
+        return length, namespace["block"]
+
+
+def _translate_instruction(instruction: int, ram_mask: int) -> List[str]:
+    """
+    Translates a single instruction into Python statements operating on
+    the `a`, `d` and `ram` locals.
+
+    If the instruction jumps, the generated code returns from the block.
+    """
+
+    if not instruction & 0x8000:
+        return [f"a = {instruction}"]
+
+    lines = []
+
+    alu_op = alu_instruction(instruction)
+    memory_input = instruction & 0x1000
+    if memory_input or instruction & 0b001000:
+        lines.append(f"address = a & {ram_mask}")
+    lines.append(f"result = {_alu_expression(alu_op, memory_input)}")
+
+    if instruction & 0b001000:
+        lines.append("ram[address] = result")
+
+    jump = instruction & 0b111
+    if jump:
+        # The jump target is the A register before this instruction
+        lines.append(f"target = a & {ADDRESS_MASK}")
+
+    if instruction & 0b100000:
+        lines.append("a = result")
+    if instruction & 0b010000:
+        lines.append("d = result")
+
+    if jump == 0b111:
+        lines.append("return a, d, target")
+    elif jump:
+        lines.append(f"if {_JUMP_CONDITIONS[jump]}:")
+        lines.append("    return a, d, target")
+
+    return lines
+
+
+def _alu_expression(instruction: int, memory_input: bool) -> str:
+    """
+    Returns a Python expression equivalent to `alu` for the given
+    ALU instruction, with the CPU's D register as x.
+    """
+
+    x = "d"
+    y = "ram[address]" if memory_input else "a"
+
+    extended = (instruction >> 7) & 0b11
+
+    if extended == 0b11:
+        if instruction & 0b100000:
+            x = "0"
+        if instruction & 0b010000:
+            x = f"({x} ^ {WORD_MASK})"
+        if instruction & 0b001000:
+            y = "0"
+        if instruction & 0b000100:
+            y = f"({y} ^ {WORD_MASK})"
+
+        if instruction & 0b000010:
+            result = f"(({x} + {y}) & {WORD_MASK})"
+        else:
+            result = f"({x} & {y})"
+
+        if instruction & 0b000001:
+            result = f"({result} ^ {WORD_MASK})"
+
+        return result
+
+    if extended == 0b01:
+        operand = x if instruction & 0b010000 else y
+        if instruction & 0b100000:
+            return f"(({operand} << 1) & {WORD_MASK})"
+        return f"(({operand} >> 1) | ({operand} & {SIGN_BIT}))"
+
+    return f"({x} ^ {y})"
+
+
+# Python conditions on `result` for each of the conditional jump specifications
+_JUMP_CONDITIONS = {
+    0b001: f"0 < result < {SIGN_BIT}",
+    0b010: "result == 0",
+    0b011: f"result < {SIGN_BIT}",
+    0b100: f"result >= {SIGN_BIT}",
+    0b101: "result != 0",
+    0b110: f"result == 0 or result >= {SIGN_BIT}",
+}
+
+
+def _jump_taken(instruction: int, result: int) -> bool:
+    if not result:
+        return bool(instruction & 0b010)
+    if result & SIGN_BIT:
+        return bool(instruction & 0b100)
+    return bool(instruction & 0b001)
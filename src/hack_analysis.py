@@ -0,0 +1,461 @@
+"""
+Static analysis of Hack programs.
+
+Builds the control-flow graph of a program, finds its loops and halt
+addresses, and bounds the number of cycles it takes to halt. The bound is
+static only for programs without loops. Programs with loops are run on
+the reference model for the given inputs instead.
+
+Can also be run as a script on a .hack file:
+
+    python hack_analysis.py lfsr.hack
+    python hack_analysis.py program.hack --input 13=1:32767 --input 14=7
+"""
+
+import argparse
+import itertools
+from typing import (
+    AbstractSet,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+
+import hack
+
+# Largest number of input combinations `cycle_bound` is willing to enumerate
+MAX_INPUT_COMBINATIONS = 1 << 16
+
+_Inputs = Mapping[int, Union[int, Iterable[int]]]
+
+
+class BasicBlock(NamedTuple):
+    """
+    A straight run of instructions, from `start` up to (not including) `end`.
+
+    `successors` are the start addresses of the blocks control may flow to
+    afterwards. Halt addresses (see `hack.halt_addresses`) are never
+    successors, as execution is over once they are reached.
+
+    `escapes` is set if the block may jump past the end of the program.
+    The CPU then runs through the zero-filled ROM until the PC wraps around,
+    so this isn't considered halting.
+    """
+
+    start: int
+    end: int
+    successors: FrozenSet[int]
+    escapes: bool
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+
+class Analysis:
+    """
+    Control-flow graph of a program.
+
+    Jump targets are resolved from the last A instruction in the same block.
+    Jumps through an address loaded from memory (`@ret; A=M; 0;JMP`)
+    are assumed to go to one of the addresses the program takes with
+    `@addr; D=A`, and are listed in `indirect_jumps`. Any other jump,
+    listed in `unresolved_jumps`, may go to any block.
+    """
+
+    def __init__(self, program: Sequence[int]):
+        self.program = [int(instruction) for instruction in program]
+        self.halts = hack.halt_addresses(self.program)
+
+        self.indirect_targets = frozenset(
+            load
+            for load, use in zip(self.program, self.program[1:])
+            if not load & 0x8000 and load <= len(self.program) and _is_d_equals_a(use)
+        )
+
+        self.indirect_jumps: List[int] = []
+        self.unresolved_jumps: List[int] = []
+
+        self.blocks = self._build_blocks()
+        self.loops = self._find_loops()
+
+    @property
+    def entry(self) -> Optional[BasicBlock]:
+        """
+        The block execution starts at, if the program doesn't halt immediately.
+        """
+        return self.blocks.get(0)
+
+    def longest_path(self) -> Optional[int]:
+        """
+        Returns the largest number of instructions that may execute before
+        the program halts, or `None` if the program has reachable loops
+        or may jump past its end.
+
+        Since not every path through the program is necessarily feasible,
+        this is an upper bound.
+        """
+
+        if self.entry is None:
+            return 0
+
+        reachable = self._reachable()
+        if any(reachable & loop for loop in self.loops):
+            return None
+        if any(self.blocks[start].escapes for start in reachable):
+            return None
+
+        lengths: Dict[int, int] = {}
+
+        def length(start: int) -> int:
+            if start not in lengths:
+                block = self.blocks[start]
+                lengths[start] = len(block) + max(
+                    (length(successor) for successor in block.successors),
+                    default=0,
+                )
+            return lengths[start]
+
+        return length(0)
+
+    def _build_blocks(self) -> Dict[int, BasicBlock]:
+        program = self.program
+
+        # Resolving jump targets requires knowing where blocks start,
+        # and vice versa. The first pass may look for the A instruction
+        # across a block boundary, so the second pass repeats it with the
+        # leaders found in the first.
+        leaders: Set[int] = set()
+        for _ in range(2):
+            self.indirect_jumps = []
+            self.unresolved_jumps = []
+
+            # Each jump, with the addresses it may go to
+            jumps: Dict[int, Set[int]] = {}
+            for address, instruction in enumerate(program):
+                if instruction & 0x8000 and instruction & 0b111:
+                    jumps[address] = self._jump_targets(address, leaders)
+
+            leaders |= {0} | self.halts | self.indirect_targets
+            for address, targets in jumps.items():
+                leaders |= {target for target in targets if target < len(program)}
+                leaders.add(address + 1)
+
+        # Indirect jumps that couldn't be narrowed down go anywhere
+        for address in self.unresolved_jumps:
+            jumps[address] = set(leaders)
+
+        blocks = {}
+        for start in sorted(leaders - self.halts):
+            end = start + 1
+            while end not in leaders and (end - 1) not in jumps:
+                end += 1
+
+            last = end - 1
+            successors = set(jumps.get(last, ()))
+            if last not in jumps or _is_conditional(program[last]):
+                successors.add(end)
+
+            blocks[start] = BasicBlock(
+                start=start,
+                end=end,
+                successors=frozenset(
+                    successor
+                    for successor in successors
+                    if successor not in self.halts and successor < len(program)
+                ),
+                escapes=any(successor > len(program) for successor in successors),
+            )
+
+        return blocks
+
+    def _jump_targets(self, address: int, leaders: AbstractSet[int]) -> Set[int]:
+        """
+        Returns the addresses the jump at `address` may go to.
+        """
+
+        # Look for the instruction that last set A
+        for source in range(address - 1, -1, -1):
+            if source + 1 in leaders:
+                # A comes from another block
+                break
+
+            instruction = self.program[source]
+
+            if not instruction & 0x8000:
+                return {instruction}
+
+            if instruction & 0b100000:
+                if _is_a_equals_m(instruction) and self.indirect_targets:
+                    # Jump through an address stored in memory
+                    self.indirect_jumps.append(address)
+                    return set(self.indirect_targets)
+                break
+
+            if instruction & 0b111:
+                break
+
+        self.unresolved_jumps.append(address)
+        return set()
+
+    def _find_loops(self) -> List[FrozenSet[int]]:
+        """
+        Returns the strongly connected components of the block graph
+        that contain a cycle, as sets of block start addresses.
+        """
+
+        index: Dict[int, int] = {}
+        lowlink: Dict[int, int] = {}
+        stack: List[int] = []
+        on_stack: Set[int] = set()
+        loops: List[FrozenSet[int]] = []
+
+        work: List[Tuple[int, Iterator[int]]] = []
+
+        def visit(node: int):
+            index[node] = lowlink[node] = len(index)
+            stack.append(node)
+            on_stack.add(node)
+            work.append((node, iter(sorted(self.blocks[node].successors))))
+
+        # Iterative version of Tarjan's algorithm
+        for root in self.blocks:
+            if root in index:
+                continue
+
+            visit(root)
+
+            while work:
+                node, successors = work[-1]
+
+                for successor in successors:
+                    if successor not in index:
+                        visit(successor)
+                        break
+                    if successor in on_stack:
+                        lowlink[node] = min(lowlink[node], index[successor])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+                    if lowlink[node] == index[node]:
+                        component = set()
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.add(member)
+                            if member == node:
+                                break
+
+                        if len(component) > 1 or node in self.blocks[node].successors:
+                            loops.append(frozenset(component))
+
+        return loops
+
+    def _reachable(self) -> FrozenSet[int]:
+        seen = set()
+        pending = [0] if 0 in self.blocks else []
+        while pending:
+            start = pending.pop()
+            if start in seen:
+                continue
+            seen.add(start)
+            pending.extend(self.blocks[start].successors)
+        return frozenset(seen)
+
+
+def cycle_bound(
+    program: Sequence[int],
+    inputs: Optional[_Inputs] = None,
+    max_cycles: int = 10_000_000,
+) -> int:
+    """
+    Returns the largest number of instructions the program executes before
+    halting, for any of the given inputs.
+
+    `inputs` maps RAM addresses to either a single value, or to all the values
+    the address may initially hold.
+
+    If the program has no reachable loops, the bound comes from the
+    longest path through it and holds for any input. Otherwise, loop trip
+    counts aren't derived statically: the bound is simulation-based. The
+    program runs on the reference model for every combination of inputs,
+    which gives the exact worst case over those inputs only. Any RAM not
+    given in `inputs` is zero.
+
+    This raises `ValueError` if there are more than `MAX_INPUT_COMBINATIONS`
+    input combinations, or if the program doesn't halt within `max_cycles`
+    instructions on one of them.
+    """
+
+    longest = Analysis(program).longest_path()
+    if longest is not None:
+        return longest
+
+    if not inputs:
+        inputs = {}
+
+    addresses = list(inputs)
+    values = [
+        [value] if isinstance(value, int) else list(value) for value in inputs.values()
+    ]
+
+    combinations = 1
+    for options in values:
+        combinations *= len(options)
+    if combinations > MAX_INPUT_COMBINATIONS:
+        raise ValueError(
+            f"Too many input combinations to enumerate ({combinations}), "
+            "narrow down the inputs"
+        )
+
+    if combinations == 1:
+        cpu = hack.TranslatingCpu(
+            program,
+            {address: options[0] for address, options in zip(addresses, values)},
+        )
+        if not cpu.run_until_halt(max_cycles):
+            raise ValueError(f"Program doesn't halt within {max_cycles} cycles")
+        return cpu.cycles
+
+    # Only pull NumPy in when there's actually something to vectorize
+    import hack_vector
+
+    columns = list(zip(*itertools.product(*values)))
+    model = hack_vector.VectorCpu(
+        program,
+        dict(zip(addresses, columns)),
+        ram_words=_ram_words(program, addresses),
+    )
+    if not model.run_until_halt(max_cycles).all():
+        raise ValueError(f"Program doesn't halt within {max_cycles} cycles")
+    return int(model.cycles.max())
+
+
+def _ram_words(program: Sequence[int], inputs: Iterable[int]) -> int:
+    """
+    Returns the smallest power-of-two RAM size that holds every address the
+    program may access: the inputs, and the A instructions that may be
+    followed by a memory access before A changes.
+
+    Programs that access memory through computed addresses get the full RAM.
+    Computing a jump target (`A=M; 0;JMP`) doesn't count, as that address
+    is in the program.
+    """
+
+    highest = max(inputs, default=0)
+    for address, instruction in enumerate(program):
+        computed = instruction & 0x8000 and instruction & 0b100000
+        if instruction & 0x8000 and not computed:
+            continue
+
+        for following in program[address + 1 :]:
+            if _accesses_m(following):
+                if computed:
+                    return hack.RAM_WORDS
+                highest = max(highest, instruction)
+                break
+            if following & 0x8000 and following & 0b111:
+                # Control may go elsewhere with A still set, and a computed
+                # A is then an address in the program
+                highest = max(highest, len(program) if computed else instruction)
+                break
+            if not following & 0x8000 or following & 0b100000:
+                break
+
+    return min(1 << highest.bit_length(), hack.RAM_WORDS)
+
+
+def _accesses_m(instruction: int) -> bool:
+    """
+    Whether the instruction reads or writes the memory A points at.
+    """
+    return bool(instruction & 0x8000 and instruction & 0b1000000001000)
+
+
+def _is_d_equals_a(instruction: int) -> bool:
+    """
+    Whether the instruction is exactly `D=A`.
+    """
+    return instruction & 0xFFFF == 0b1110110000010000
+
+
+def _is_a_equals_m(instruction: int) -> bool:
+    """
+    Whether the instruction computes M and stores it in A (and maybe elsewhere).
+    """
+    return instruction & 0xFFC0 == 0b1111110000000000
+
+
+def _is_conditional(instruction: int) -> bool:
+    return instruction & 0b111 != 0b111
+
+
+def parse_input(text: str) -> Tuple[int, Union[int, range]]:
+    """
+    Parses ADDR=VALUE or ADDR=LOW:HIGH (inclusive).
+    """
+    address, _, value = text.partition("=")
+    if ":" in value:
+        low, _, high = value.partition(":")
+        return int(address, 0), range(int(low, 0), int(high, 0) + 1)
+    return int(address, 0), int(value, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("program", help="Path to a .hack file")
+    parser.add_argument(
+        "--input",
+        action="append",
+        default=[],
+        type=parse_input,
+        metavar="ADDR=VALUE|ADDR=LOW:HIGH",
+        help="Initial RAM contents to bound the cycle count for",
+    )
+    args = parser.parse_args()
+
+    program = hack.load_hack(args.program)
+    analysis = Analysis(program)
+
+    print("Blocks:")
+    for block in analysis.blocks.values():
+        successors = ", ".join(f"0x{s:04X}" for s in sorted(block.successors))
+        print(f"  0x{block.start:04X}-0x{block.end - 1:04X} -> [{successors}]")
+
+    print("Loops:")
+    for loop in analysis.loops:
+        print("  " + ", ".join(f"0x{start:04X}" for start in sorted(loop)))
+
+    print("Halts: " + ", ".join(f"0x{h:04X}" for h in sorted(analysis.halts)))
+
+    if analysis.indirect_jumps:
+        print(
+            "Indirect jumps: "
+            + ", ".join(f"0x{j:04X}" for j in analysis.indirect_jumps)
+        )
+
+    if analysis.unresolved_jumps:
+        print(
+            "Unresolved jumps: "
+            + ", ".join(f"0x{j:04X}" for j in analysis.unresolved_jumps)
+        )
+
+    try:
+        print(f"Cycle bound: {cycle_bound(program, dict(args.input))}")
+    except ValueError as e:
+        print(f"Cycle bound: no bound for these inputs ({e})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Assembler for the extended Hack CPU.
+
+Accepts the standard Hack assembly language (labels, variables and the
+predefined symbols), plus the extended ALU operations:
+
+    D^A, D^M        XOR (A^D and M^D are accepted as well)
+    A>>, M>>, D>>   Arithmetic shift right by one
+    A<<, M<<, D<<   Shift left by one
+
+Assembled programs are cached in a .cache directory next to the source file,
+keyed on the hash of the source, so unchanged sources are never reassembled.
+
+Can also be run as a script:
+
+    python hack_asm.py lfsr.asm -o lfsr.hack
+"""
+
+import argparse
+import functools
+import hashlib
+import itertools
+import os
+import re
+import tempfile
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import hack
+
+# Bump whenever the output for the same source may change,
+# to invalidate the cache
+_CACHE_VERSION = 1
+
+CACHE_DIR_NAME = ".cache"
+
+
+def _comp_table() -> Dict[str, int]:
+    """
+    Maps each computation to bits 14:6 of a C instruction: the extended ALU
+    mode, the a bit, and the ALU control bits.
+    """
+
+    normal = {
+        "0": 0b101010,
+        "1": 0b111111,
+        "-1": 0b111010,
+        "D": 0b001100,
+        "A": 0b110000,
+        "!D": 0b001101,
+        "!A": 0b110001,
+        "-D": 0b001111,
+        "-A": 0b110011,
+        "D+1": 0b011111,
+        "A+1": 0b110111,
+        "D-1": 0b001110,
+        "A-1": 0b110010,
+        "D+A": 0b000010,
+        "D-A": 0b010011,
+        "A-D": 0b000111,
+        "D&A": 0b000000,
+        "D|A": 0b010101,
+        "A+D": 0b000010,
+        "A&D": 0b000000,
+        "A|D": 0b010101,
+    }
+
+    # Comp bit 5 selects a left shift, and bit 4 shifts D instead of A/M
+    shifts = {
+        "A>>": 0b000000,
+        "D>>": 0b010000,
+        "A<<": 0b100000,
+        "D<<": 0b110000,
+    }
+
+    xors = {
+        "D^A": 0b000000,
+        "A^D": 0b000000,
+    }
+
+    table = {}
+    for mode, computations in ((0b11, normal), (0b01, shifts), (0b00, xors)):
+        for comp, bits in computations.items():
+            table[comp] = (mode << 7) | bits
+            if "A" in comp:
+                table[comp.replace("A", "M")] = (mode << 7) | (1 << 6) | bits
+    return table
+
+
+def _dest_table() -> Dict[str, int]:
+    """
+    Maps each destination to bits 5:3 of a C instruction.
+    A, D and M may be listed in any order.
+    """
+
+    table = {"": 0b000}
+    for count in range(1, 4):
+        for letters in itertools.permutations("ADM", count):
+            table["".join(letters)] = (
+                (0b100 if "A" in letters else 0)
+                | (0b010 if "D" in letters else 0)
+                | (0b001 if "M" in letters else 0)
+            )
+    return table
+
+
+COMP = _comp_table()
+DEST = _dest_table()
+
+JUMP: Dict[str, int] = {
+    "": 0b000,
+    "JGT": 0b001,
+    "JEQ": 0b010,
+    "JGE": 0b011,
+    "JLT": 0b100,
+    "JNE": 0b101,
+    "JLE": 0b110,
+    "JMP": 0b111,
+}
+
+PREDEFINED_SYMBOLS: Dict[str, int] = {
+    "SP": 0,
+    "LCL": 1,
+    "ARG": 2,
+    "THIS": 3,
+    "THAT": 4,
+    **{f"R{i}": i for i in range(16)},
+    "SCREEN": 0x4000,
+    "KBD": 0x6000,
+}
+
+# Variables are allocated from this address up
+VARIABLE_BASE = 16
+
+_SYMBOL = re.compile(r"[A-Za-z_.$:][\w.$:]*")
+
+
+class AssemblerError(ValueError):
+    """
+    Raised for invalid assembly source, with the offending line number.
+    """
+
+    def __init__(self, line_number: int, message: str):
+        super().__init__(f"line {line_number}: {message}")
+        self.line_number = line_number
+
+
+def assemble(source: str) -> List[int]:
+    """
+    Assembles Hack assembly source into a list of instructions.
+    """
+    program, _ = _assemble(source)
+    return program
+
+
+def data_symbols(source: str) -> Dict[str, int]:
+    """
+    Returns the RAM address of every symbol in the source that isn't a label,
+    i.e. of the variables and the predefined symbols.
+    """
+    _, symbols = _assemble(source)
+    return symbols
+
+
+def _assemble(source: str) -> Tuple[List[int], Dict[str, int]]:
+    # Strip comments and all whitespace, as the original assembler does
+    lines = []
+    for line_number, line in enumerate(source.splitlines(), start=1):
+        line = "".join(line.split("//", 1)[0].split())
+        if line:
+            lines.append((line_number, line))
+
+    # First pass: labels
+    labels: Dict[str, int] = {}
+    address = 0
+    for line_number, line in lines:
+        if line.startswith("("):
+            if not line.endswith(")") or not _SYMBOL.fullmatch(line[1:-1]):
+                raise AssemblerError(line_number, f"Invalid label {line}")
+            label = line[1:-1]
+            if label in labels or label in PREDEFINED_SYMBOLS:
+                raise AssemblerError(line_number, f"Redefinition of {label}")
+            labels[label] = address
+        else:
+            address += 1
+
+    if address > hack.ROM_WORDS:
+        raise AssemblerError(lines[-1][0], "Program doesn't fit in ROM")
+
+    # Second pass: instructions
+    program = []
+    symbols = dict(PREDEFINED_SYMBOLS)
+    next_variable = VARIABLE_BASE
+    for line_number, line in lines:
+        if line.startswith("("):
+            continue
+
+        if line.startswith("@"):
+            value = line[1:]
+            if value.isdigit():
+                address = int(value)
+            elif value in labels:
+                address = labels[value]
+            elif _SYMBOL.fullmatch(value):
+                if value not in symbols:
+                    symbols[value] = next_variable
+                    next_variable += 1
+                address = symbols[value]
+            else:
+                raise AssemblerError(line_number, f"Invalid A instruction {line}")
+
+            if address > hack.ADDRESS_MASK:
+                raise AssemblerError(line_number, f"{address} is out of range")
+
+            program.append(address)
+            continue
+
+        program.append(_assemble_c_instruction(line_number, line))
+
+    return program, symbols
+
+
+def assemble_file(path: str, cache: bool = True) -> List[int]:
+    """
+    Assembles a .asm file.
+
+    If `cache` is set, the result is kept under a .cache directory next to
+    the source, and reused for as long as the source doesn't change.
+    """
+
+    with open(path, mode="r", encoding="ASCII") as f:
+        source = f.read()
+
+    if not cache:
+        return assemble(source)
+
+    digest = hashlib.sha256(f"{_CACHE_VERSION}\n{source}".encode("ASCII"))
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    cache_path = os.path.join(cache_dir, f"{digest.hexdigest()}.hack")
+
+    if os.path.exists(cache_path):
+        return hack.load_hack(cache_path)
+
+    program = assemble(source)
+
+    # Several simulations may be assembling the same file,
+    # so write to a temporary file and move it into place
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="w", encoding="ASCII") as f:
+            f.write(to_hack(program))
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+    return program
+
+
+def to_hack(program: Sequence[int]) -> str:
+    """
+    Formats a program in the .hack format, one binary instruction per line.
+    """
+    return "".join(f"{instruction & hack.WORD_MASK:016b}\n" for instruction in program)
+
+
+@functools.lru_cache(maxsize=None)
+def c_instruction(dest: str, comp: str, jump: str = "") -> int:
+    """
+    Encodes a C instruction from its mnemonics, as in `dest=comp;jump`.
+    """
+
+    try:
+        return 0x8000 | (COMP[comp] << 6) | (DEST[dest] << 3) | JUMP[jump]
+    except KeyError as e:
+        raise ValueError(f"Invalid C instruction {dest}={comp};{jump}") from e
+
+
+class ProgramBuilder:
+    """
+    Builds a program instruction by instruction, straight into an
+    `array('H')` that can be used wherever a program is expected.
+
+        program = ProgramBuilder().a(5).c("D", "A").a(0).c("M", "D").program
+    """
+
+    def __init__(self):
+        self.program = array("H")
+
+    def __len__(self) -> int:
+        return len(self.program)
+
+    def a(self, value: int) -> "ProgramBuilder":
+        """
+        Appends `@value`.
+        """
+        if not 0 <= value <= hack.ADDRESS_MASK:
+            raise ValueError(f"{value} is out of range")
+        self.program.append(value)
+        return self
+
+    def c(self, dest: str, comp: str, jump: str = "") -> "ProgramBuilder":
+        """
+        Appends `dest=comp;jump`. Leave `dest` empty for just `comp;jump`.
+        """
+        self.program.append(c_instruction(dest, comp, jump))
+        return self
+
+
+def _assemble_c_instruction(line_number: int, line: str) -> int:
+    dest, _, rest = line.rpartition("=")
+    comp, _, jump = rest.partition(";")
+
+    if dest not in DEST:
+        raise AssemblerError(line_number, f"Invalid destination {dest}")
+    if comp not in COMP:
+        raise AssemblerError(line_number, f"Invalid computation {comp}")
+    if jump not in JUMP:
+        raise AssemblerError(line_number, f"Invalid jump {jump}")
+
+    return c_instruction(dest, comp, jump)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="Path to a .asm file")
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="Path to the .hack file to write (defaults to the source's name)",
+    )
+    args = parser.parse_args()
+
+    output: Optional[str] = args.output
+    if output is None:
+        output = os.path.splitext(args.source)[0] + ".hack"
+
+    program = assemble_file(args.source, cache=False)
+
+    with open(output, mode="w", encoding="ASCII") as f:
+        f.write(to_hack(program))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,572 @@
+"""
+Peephole optimizer for Hack assembly.
+
+Works on the assembly source, before labels are resolved, so removing
+instructions never breaks jump targets. Code addresses must therefore be
+referenced through labels, not numerically (`ValueError` is raised for
+jumps that aren't). The first use of each variable is always kept, so
+variables stay at the same addresses.
+
+The following rewrites are applied until none of them matches anymore:
+
+- Two instructions are folded into one if the first only computes D from
+  A or M, the second uses that D, and a single computation (possibly one
+  of the extended ones) gives the same result for every possible value of
+  A or M. For example, `D=M; D=D+M` becomes `D=M<<`, and `D=!M; M=D+1`
+  becomes `M=-M`. If the second instruction doesn't write D, this requires
+  D to be dead afterwards.
+- An instruction that combines D with A or M, where D is known to hold
+  that same value, is replaced by a computation of A or M alone.
+  For example, `D=M; M=D+M` becomes `D=M; M=M<<` while D is still needed.
+- Runs of instructions that only recompute the value D already holds
+  are removed, e.g. `@x; D=M; @y; D=D-M` when nothing wrote x or y since
+  D was last computed that way.
+- Loads of a value A already holds are removed.
+- An A instruction immediately followed by another one is removed.
+- Instructions that only write a dead D are removed.
+
+The extended computations only help where a value is combined with
+itself, which the stock programs don't do: mult.asm only gains the plain
+Hack `M=-M` (49 -> 47 instructions), divide.asm only loses a redundant
+recomputation of D (74 -> 70), and sort.asm is unchanged.
+
+Can also be run as a script, to see the savings for given inputs:
+
+    python hack_opt.py mult.asm --input 0=123 --input 1=45
+"""
+
+import argparse
+import functools
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import hack
+import hack_analysis
+import hack_asm
+
+
+class Rewrite(NamedTuple):
+    """
+    A single change made by the optimizer, with the instructions it replaced
+    and the ones it replaced them with.
+    """
+
+    line_number: int
+    before: Tuple[str, ...]
+    after: Tuple[str, ...]
+
+
+class Result(NamedTuple):
+    """
+    The optimized source, and the sizes of the program before and after.
+    """
+
+    source: str
+    rewrites: List[Rewrite]
+    size_before: int
+    size_after: int
+
+
+class _Line:
+    """
+    A line of source. `code` is the instruction with comments and
+    whitespace stripped, and empty for lines without one.
+    """
+
+    def __init__(self, line_number: int, text: str):
+        self.line_number = line_number
+        self.text = text
+        self.code = "".join(text.split("//", 1)[0].split())
+        self.removed = False
+
+    @property
+    def is_label(self) -> bool:
+        return self.code.startswith("(")
+
+    @property
+    def is_a(self) -> bool:
+        return self.code.startswith("@")
+
+    @property
+    def is_c(self) -> bool:
+        return bool(self.code) and not self.is_label and not self.is_a
+
+    @property
+    def fields(self) -> Tuple[str, str, str]:
+        """
+        The destination, computation and jump of a C instruction.
+        """
+        dest, _, rest = self.code.rpartition("=")
+        comp, _, jump = rest.partition(";")
+        return dest, comp, jump
+
+    def replace(self, code: str):
+        """
+        Replaces the instruction, keeping the line's indentation and comment.
+        """
+        before, slash, comment = self.text.partition("//")
+        indent = before[: len(before) - len(before.lstrip())]
+        spacing = before[len(before.rstrip()) :] if slash else ""
+        self.code = code
+        self.text = f"{indent}{code}{spacing}{slash}{comment}"
+
+    def remove(self) -> Rewrite:
+        rewrite = Rewrite(self.line_number, (self.code,), ())
+        self.code = self.text = ""
+        self.removed = True
+        return rewrite
+
+
+def optimize(source: str) -> Result:
+    """
+    Optimizes Hack assembly source, returning the new source along with
+    the rewrites that were made.
+    """
+
+    # Make sure the source is valid to begin with
+    size_before = len(hack_asm.assemble(source))
+
+    lines = [
+        _Line(line_number, text)
+        for line_number, text in enumerate(source.splitlines(), start=1)
+    ]
+
+    symbols = hack_asm.data_symbols(source)
+
+    rewrites: List[Rewrite] = []
+    while True:
+        rewrite = _rewrite_once(lines, symbols)
+        if rewrite is None:
+            break
+        rewrites.append(rewrite)
+
+    optimized = "".join(f"{line.text}\n" for line in lines if not line.removed)
+    size_after = len(hack_asm.assemble(optimized))
+
+    return Result(
+        source=optimized,
+        rewrites=rewrites,
+        size_before=size_before,
+        size_after=size_after,
+    )
+
+
+def _rewrite_once(lines: List[_Line], symbols: Dict[str, int]) -> Optional[Rewrite]:
+    """
+    Applies the first rewrite that matches, if any.
+    """
+
+    code = [line for line in lines if line.code]
+    states = _states(code, symbols)
+    live = _d_liveness(code, states)
+
+    # Variables are allocated in order of first use,
+    # so removing a first use would move them around
+    first_uses: Set[int] = set()
+    seen: Set[str] = set(hack_asm.PREDEFINED_SYMBOLS)
+    for i, line in enumerate(code):
+        operand = line.code[1:]
+        if line.is_a and operand in symbols and operand not in seen:
+            first_uses.add(i)
+            seen.add(operand)
+
+    for i, line in enumerate(code):
+        following = code[i + 1] if i + 1 < len(code) else None
+
+        if line.is_a and i not in first_uses:
+            if states[i].a is not None and states[i].a == _a_value(line, symbols):
+                return line.remove()
+
+            if following is not None and following.is_a:
+                return line.remove()
+
+        if not line.is_c:
+            continue
+
+        run = _redundant_run(code, i, states[i], symbols)
+        if run and not first_uses.intersection(range(i, i + run)):
+            removed = code[i : i + run]
+            rewrite = Rewrite(line.line_number, tuple(r.code for r in removed), ())
+            for redundant in removed:
+                redundant.remove()
+            return rewrite
+
+        dest, comp, jump = line.fields
+
+        if dest == "D" and not jump and not live[i]:
+            return line.remove()
+
+        substituted = _substitute(comp, states[i])
+        if substituted is not None:
+            after = f"{dest}={substituted}" if dest else substituted
+            if jump:
+                after += f";{jump}"
+
+            before = (line.code,)
+            line.replace(after)
+            return Rewrite(line.line_number, before, (after,))
+
+        if dest != "D" or jump or "D" in comp:
+            continue
+        if following is None or not following.is_c:
+            continue
+
+        second_dest, second_comp, second_jump = following.fields
+        if "D" not in second_comp:
+            continue
+        if "D" not in second_dest and live[i + 1]:
+            continue
+
+        folded = _fold(comp, second_comp)
+        if folded is None:
+            continue
+
+        before = (line.code, following.code)
+        after = f"{second_dest}={folded}" if second_dest else folded
+        if second_jump:
+            after += f";{second_jump}"
+
+        line.remove()
+        following.replace(after)
+        return Rewrite(line.line_number, before, (after,))
+
+    return None
+
+
+# What A or D is known to hold, as a hashable expression. Equal expressions
+# evaluate to the same value, as long as the memory they read is unchanged.
+_Value = Tuple
+
+
+class _State(NamedTuple):
+    a: Optional[_Value]
+    d: Optional[_Value]
+
+
+def _a_value(line: _Line, symbols: Dict[str, int]) -> _Value:
+    """
+    The value an A instruction loads. Labels are kept symbolic, as their
+    addresses change whenever instructions are removed.
+    """
+
+    operand = line.code[1:]
+    if operand.isdigit():
+        return ("word", int(operand))
+    if operand in symbols:
+        return ("word", symbols[operand])
+    return ("label", operand)
+
+
+def _reads_memory(value: Optional[_Value], address: Optional[int]) -> bool:
+    """
+    Whether the expression reads RAM at the given address,
+    or anywhere if `address` is `None`.
+    """
+
+    if value is None:
+        return False
+    if value[0] == "M":
+        return address is None or value[1] == address
+    if value[0] == "comp":
+        return _reads_memory(value[2], address) or _reads_memory(value[3], address)
+    return False
+
+
+def _step(state: _State, line: _Line, symbols: Dict[str, int]) -> _State:
+    """
+    Returns what A and D are known to hold after the instruction executes
+    (and doesn't jump).
+    """
+
+    if line.is_label:
+        # Control may come from anywhere
+        return _State(None, None)
+
+    if line.is_a:
+        return _State(_a_value(line, symbols), state.d)
+
+    dest, comp, _ = line.fields
+
+    operand: Optional[_Value] = None
+    if "A" in comp:
+        operand = state.a
+    elif "M" in comp and state.a is not None and state.a[0] == "word":
+        operand = ("M", state.a[1])
+
+    result: Optional[_Value] = ("comp", comp, None, None)
+    if "D" in comp:
+        result = None if state.d is None else result[:2] + (state.d, None)
+    if result is not None and _operand(comp):
+        result = None if operand is None else result[:3] + (operand,)
+
+    a = None if "A" in dest else state.a
+    d = result if "D" in dest else state.d
+
+    if "M" in dest:
+        # Forget whatever read the memory that was just written
+        address = None
+        if state.a is not None and state.a[0] == "word":
+            address = state.a[1]
+        if _reads_memory(d, address):
+            d = None
+
+    return _State(a, d)
+
+
+def _states(code: List[_Line], symbols: Dict[str, int]) -> List[_State]:
+    """
+    For each instruction, what A and D are known to hold right before it.
+    """
+
+    states = []
+    state = _State(None, None)
+    for line in code:
+        if line.is_label:
+            state = _State(None, None)
+        states.append(state)
+        state = _step(state, line, symbols)
+    return states
+
+
+def _redundant_run(
+    code: List[_Line], start: int, state: _State, symbols: Dict[str, int]
+) -> int:
+    """
+    Looks for a run of instructions starting at `start` that only recomputes
+    the value D already holds. Returns its length, or 0 if there's none.
+
+    The run may only contain A instructions and C instructions that write
+    just D, without jumping. Afterwards, A must either hold the same value
+    as before, or be overwritten right away.
+    """
+
+    if state.d is None:
+        return 0
+
+    current = state
+    for end in range(start, len(code)):
+        line = code[end]
+        if line.is_label:
+            return 0
+        if line.is_c and (line.fields[0] != "D" or line.fields[2]):
+            return 0
+
+        current = _step(current, line, symbols)
+        if current.d is None:
+            return 0
+        if current.d != state.d:
+            continue
+
+        following = code[end + 1] if end + 1 < len(code) else None
+        if current.a == state.a or (following is not None and following.is_a):
+            return end + 1 - start
+
+    return 0
+
+
+def _d_liveness(code: List[_Line], states: List[_State]) -> List[bool]:
+    """
+    For each instruction, whether D may be read after it executes.
+
+    Falling off the end of the program is assumed to keep D alive, as the
+    program may wrap around and run again. So are jumps to unknown targets.
+    """
+
+    labels = {line.code[1:-1]: i for i, line in enumerate(code) if line.is_label}
+
+    # Successors of each instruction, or None if they aren't known
+    successors: List[Optional[Set[int]]] = []
+    for i, line in enumerate(code):
+        following = {i + 1} if i + 1 < len(code) else None
+
+        if not line.is_c or not line.fields[2]:
+            successors.append(following)
+            continue
+
+        target = states[i].a
+        if target is None:
+            successors.append(None)
+            continue
+        if target[0] != "label":
+            raise ValueError(
+                f"line {line.line_number}: jump target isn't a label, "
+                "so it would move when instructions are removed"
+            )
+
+        targets = {labels[target[1]]}
+        if line.fields[2] != "JMP":
+            if following is None:
+                successors.append(None)
+                continue
+            targets |= following
+        successors.append(targets)
+
+    live_in = [False] * len(code)
+    live_out = [False] * len(code)
+
+    changed = True
+    while changed:
+        changed = False
+        for i in reversed(range(len(code))):
+            line = code[i]
+
+            nexts = successors[i]
+            out = nexts is None or any(live_in[j] for j in nexts)
+
+            reads = writes = False
+            if line.is_c:
+                dest, comp, _ = line.fields
+                reads = "D" in comp
+                writes = "D" in dest
+
+            new_in = reads or (out and not writes)
+            if out != live_out[i] or new_in != live_in[i]:
+                live_out[i] = out
+                live_in[i] = new_in
+                changed = True
+
+    return live_out
+
+
+def _operand(comp: str) -> Optional[str]:
+    """
+    Which of A or M the computation reads, if any.
+    """
+    if "A" in comp:
+        return "A"
+    if "M" in comp:
+        return "M"
+    return None
+
+
+def _substitute(comp: str, state: _State) -> Optional[str]:
+    """
+    Finds a computation equivalent to `comp` that doesn't read D,
+    if D holds exactly the value of the operand `comp` reads.
+    """
+
+    operand = _operand(comp)
+    if operand is None or "D" not in comp:
+        return None
+
+    value = state.a
+    if operand == "M":
+        if state.a is None or state.a[0] != "word":
+            return None
+        value = ("M", state.a[1])
+
+    if value is None or state.d != ("comp", operand, None, value):
+        return None
+
+    return _fold(operand, comp)
+
+
+@functools.lru_cache(maxsize=None)
+def _fold(first: str, second: str) -> Optional[str]:
+    """
+    Finds a single computation equivalent to `D=first` followed by `second`,
+    where `first` doesn't read D and `second` does.
+
+    Both are evaluated on every possible value of A or M at once, and the
+    result is looked up among the tables of the computations that don't
+    read D.
+    """
+
+    operands = {_operand(first), _operand(second)} - {None}
+    if len(operands) > 1:
+        return None
+    operand = operands.pop() if operands else None
+
+    y = _all_words()
+    combined = _compute(second, _compute(first, 0 * y, y), y)
+    return _comp_tables(operand).get(combined.tobytes())
+
+
+@functools.lru_cache(maxsize=None)
+def _all_words():
+    # Only pull NumPy in once there's something to fold
+    import numpy as np
+
+    return np.arange(-(1 << 15), 1 << 15, dtype=np.int16)
+
+
+def _compute(comp: str, d, y):
+    import hack_vector
+
+    instruction = 0x8000 | (hack_asm.COMP[comp] << 6)
+    return hack_vector.alu(d, y, hack.alu_instruction(instruction))
+
+
+@functools.lru_cache(maxsize=None)
+def _comp_tables(operand: Optional[str]) -> Dict[bytes, str]:
+    """
+    Maps the results of each computation that doesn't read D, over every
+    possible value of A or M, to the computation. The first of several
+    equivalent computations wins.
+    """
+
+    y = _all_words()
+    tables: Dict[bytes, str] = {}
+    for comp in _COMP_BY_OPERAND[operand]:
+        tables.setdefault(_compute(comp, 0 * y, y).tobytes(), comp)
+    return tables
+
+
+def _comp_by_operand() -> Dict[Optional[str], List[str]]:
+    """
+    The computations that don't read D, by the operand they are allowed
+    to read.
+    """
+
+    independent = [comp for comp in hack_asm.COMP if "D" not in comp]
+    return {
+        operand: [comp for comp in independent if _operand(comp) in (None, operand)]
+        for operand in (None, "A", "M")
+    }
+
+
+_COMP_BY_OPERAND = _comp_by_operand()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="Path to a .asm file")
+    parser.add_argument("-o", "--output", help="Path to write the optimized source to")
+    parser.add_argument(
+        "--input",
+        action="append",
+        default=[],
+        type=hack_analysis.parse_input,
+        metavar="ADDR=VALUE|ADDR=LOW:HIGH",
+        help="Initial RAM contents to compare the cycle counts for",
+    )
+    args = parser.parse_args()
+
+    with open(args.source, mode="r", encoding="ASCII") as f:
+        source = f.read()
+
+    result = optimize(source)
+
+    for rewrite in result.rewrites:
+        before = "; ".join(rewrite.before)
+        after = "; ".join(rewrite.after) or "(removed)"
+        print(f"{rewrite.line_number}: {before} -> {after}")
+
+    print(f"Size: {result.size_before} -> {result.size_after} instructions")
+
+    inputs = dict(args.input)
+    try:
+        cycles_before = hack_analysis.cycle_bound(hack_asm.assemble(source), inputs)
+        cycles_after = hack_analysis.cycle_bound(
+            hack_asm.assemble(result.source), inputs
+        )
+        print(f"Cycles: {cycles_before} -> {cycles_after}")
+    except ValueError as e:
+        print(f"Cycles: no bound for these inputs ({e})")
+
+    if args.output:
+        with open(args.output, mode="w", encoding="ASCII") as f:
+            f.write(result.source)
+
+
+if __name__ == "__main__":
+    main()
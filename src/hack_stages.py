@@ -0,0 +1,289 @@
+"""
+Splits Hack programs into stages that fit a tiny PROM.
+
+The top level (mbikovitsky_top) has a PROM of only ROM_WORDS instructions,
+and maps all of memory to the single word `cpu_io_out`. Longer programs
+can still run by uploading them in stages, resetting the CPU (but not the
+memory) in between. Only `cpu_io_out` survives a CPU reset, while A, D and
+the PC go back to 0.
+
+With no inputs other than that word, a program always executes the same
+way. So the program is first run on the reference model, and its trace of
+executed instructions is what gets split. Loops are unrolled and jumps
+disappear, leaving straight-line code. Every stage then simply runs for as
+many cycles as it has instructions. Where a stage starts with A or D
+holding something other than 0, and the stage needs that value, the stage
+starts by loading it again.
+
+The cut points are chosen to minimize the total time, which mostly goes
+into uploading the stages.
+"""
+
+import functools
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import hack
+import hack_asm
+
+# Memory of the top level, which is a single word
+TOP_RAM_WORDS = 1
+
+
+class Stage(NamedTuple):
+    """
+    A stage to upload and run for `len(program)` cycles.
+
+    `prologue` is the number of instructions at the start of the program
+    that only restore A and D.
+    """
+
+    program: List[int]
+    prologue: int
+
+    @property
+    def cycles(self) -> int:
+        return len(self.program)
+
+
+class _Step(NamedTuple):
+    instruction: int
+    a: int
+    d: int
+
+
+def trace(
+    program: List[int], memory: int = 0, max_cycles: int = 1_000_000
+) -> List[_Step]:
+    """
+    Runs the program on the top level's memory map until it halts,
+    and returns the instructions it executed, along with the values of A
+    and D before each one.
+
+    Jumps are stripped from the returned instructions.
+    """
+
+    cpu = hack.Cpu(program, {0: memory}, ram_words=TOP_RAM_WORDS)
+
+    steps = []
+    while not cpu.halted:
+        if cpu.cycles >= max_cycles:
+            raise ValueError(f"Program doesn't halt within {max_cycles} cycles")
+
+        instruction = cpu.instruction
+        if instruction & 0x8000:
+            instruction &= ~0b111
+        steps.append(_Step(instruction, cpu.a, cpu.d))
+
+        cpu.step()
+
+    return steps
+
+
+def plan(
+    program: List[int],
+    rom_words: int,
+    word_cost: float,
+    stage_cost: float = 0,
+    memory: int = 0,
+    max_cycles: int = 1_000_000,
+) -> List[Stage]:
+    """
+    Splits the program into stages of at most `rom_words` instructions.
+
+    `word_cost` is the time it takes to upload one instruction, and
+    `stage_cost` is the fixed time it takes to start a stage, both in clock
+    cycles. Running a stage takes one cycle per instruction on top of that.
+    `memory` is the value `cpu_io_out` holds when the first stage starts.
+
+    Raises `ValueError` if the program doesn't halt, or if it can't be
+    split at all.
+    """
+
+    steps = _drop_dead(trace(program, memory, max_cycles))
+
+    # Whether A and D are read before they're overwritten, from each step on
+    a_live = [False] * (len(steps) + 1)
+    d_live = [False] * (len(steps) + 1)
+    for i in reversed(range(len(steps))):
+        reads_a, writes_a, reads_d, writes_d = _accesses(steps[i].instruction)
+        a_live[i] = reads_a or (a_live[i + 1] and not writes_a)
+        d_live[i] = reads_d or (d_live[i + 1] and not writes_d)
+
+    prologues = [
+        _restore(
+            step.a if a_live[i] else None,
+            step.d if d_live[i] else None,
+        )
+        for i, step in enumerate(steps)
+    ]
+
+    # best[j] is the cheapest way to run the first j steps,
+    # along with the start of the last stage
+    best: List[Optional[float]] = [0.0] + [None] * len(steps)
+    previous = [0] * (len(steps) + 1)
+    for end in range(1, len(steps) + 1):
+        for start in range(end - 1, max(end - rom_words, 0) - 1, -1):
+            prologue = prologues[start]
+            if prologue is None or best[start] is None:
+                continue
+
+            size = len(prologue) + end - start
+            if size > rom_words:
+                continue
+
+            cost = best[start] + stage_cost + size * (word_cost + 1)
+            if best[end] is None or cost < best[end]:
+                best[end] = cost
+                previous[end] = start
+
+    if best[len(steps)] is None:
+        raise ValueError(f"Can't split the program into stages of {rom_words}")
+
+    stages = []
+    end = len(steps)
+    while end > 0:
+        start = previous[end]
+        prologue = prologues[start]
+        assert prologue is not None
+        stages.append(
+            Stage(
+                program=list(prologue)
+                + [step.instruction for step in steps[start:end]],
+                prologue=len(prologue),
+            )
+        )
+        end = start
+    stages.reverse()
+
+    return stages
+
+
+def _drop_dead(steps: List[_Step]) -> List[_Step]:
+    """
+    Removes the steps that don't write memory, and whose writes to A and D
+    are overwritten before they're read. Those are mostly what's left of
+    jumps: their target's A instruction, and a bare computation.
+    """
+
+    kept = []
+    a_live = d_live = False
+    for step in reversed(steps):
+        reads_a, writes_a, reads_d, writes_d = _accesses(step.instruction)
+        writes_m = bool(step.instruction & 0x8000 and step.instruction & 0b001000)
+        if not (writes_m or (writes_a and a_live) or (writes_d and d_live)):
+            continue
+
+        kept.append(step)
+        a_live = reads_a or (a_live and not writes_a)
+        d_live = reads_d or (d_live and not writes_d)
+
+    kept.reverse()
+    return kept
+
+
+def _accesses(instruction: int) -> Tuple[bool, bool, bool, bool]:
+    """
+    Returns whether the instruction reads and writes A, and reads and writes D.
+    Jumps are assumed to have been stripped.
+    """
+
+    if not instruction & 0x8000:
+        return False, True, False, False
+
+    alu = hack.alu_instruction(instruction)
+    extended = (alu >> 7) & 0b11
+    if extended == 0b11:
+        uses_x = not alu & 0b100000  # zx
+        uses_y = not alu & 0b001000  # zy
+    elif extended == 0b01:
+        uses_x = bool(alu & 0b010000)
+        uses_y = not uses_x
+    else:
+        uses_x = uses_y = True
+
+    reads_a = uses_y and not instruction & 0x1000
+    return reads_a, bool(instruction & 0b100000), uses_x, bool(instruction & 0b010000)
+
+
+@functools.lru_cache(maxsize=None)
+def _restore(a: Optional[int], d: Optional[int]) -> Optional[Tuple[int, ...]]:
+    """
+    Finds the shortest sequence of instructions (out of a few shapes) that
+    loads A and D with the given values, starting from reset. `None` means
+    the register's value doesn't matter.
+
+    Returns `None` if no sequence of up to three instructions works.
+    """
+
+    def matches(sequence: Tuple[int, ...]) -> bool:
+        result_a, result_d = _simulate(sequence)
+        return (a is None or result_a == a) and (d is None or result_d == d)
+
+    loads = [
+        (value,)
+        for value in sorted(
+            {
+                value & hack.WORD_MASK
+                for register in (a, d)
+                if register is not None
+                for value in (register, ~register, -register)
+            }
+        )
+        if value <= hack.ADDRESS_MASK
+    ]
+    computations = [(instruction,) for instruction in _RESTORE_COMPUTATIONS]
+
+    shapes: List[Iterable[Tuple[int, ...]]] = [
+        [()],
+        loads + computations,
+        (load + computation for load in loads for computation in computations),
+        (computation + load for computation in computations for load in loads),
+        (
+            load + computation + other_load
+            for load in loads
+            for computation in computations
+            for other_load in loads
+        ),
+        (
+            load + (hack_asm.c_instruction("A", "!A"),) + computation
+            for load in loads
+            for computation in computations
+        ),
+    ]
+
+    for sequences in shapes:
+        for sequence in sequences:
+            if matches(sequence):
+                return sequence
+
+    return None
+
+
+# Computations that don't read memory, as its value must be preserved
+_RESTORE_COMPUTATIONS = [
+    hack_asm.c_instruction(dest, comp)
+    for comp in hack_asm.COMP
+    if "M" not in comp
+    for dest in ("D", "A", "AD")
+]
+
+
+def _simulate(sequence: Tuple[int, ...]) -> Tuple[int, int]:
+    """
+    Returns the values of A and D after running the given instructions
+    from reset, without touching memory.
+    """
+
+    a = d = 0
+    for instruction in sequence:
+        if not instruction & 0x8000:
+            a = instruction
+            continue
+
+        result = hack.alu(d, a, hack.alu_instruction(instruction))
+        if instruction & 0b100000:
+            a = result
+        if instruction & 0b010000:
+            d = result
+
+    return a, d
@@ -0,0 +1,208 @@
+"""
+Vectorized model of the extended Hack CPU.
+
+Runs a single program over many independent input vectors at once.
+Registers and RAM are held as NumPy int16 arrays, with one row per vector.
+"""
+
+from typing import Mapping, Optional, Sequence, Union
+
+import numpy as np
+import numpy.typing as npt
+
+import hack
+
+_Values = Union[int, npt.ArrayLike]
+
+
+class VectorCpu:
+    """
+    Runs `count` copies of the CPU in lockstep, one for each input vector.
+
+    All vectors execute the same program, but may take different branches.
+    On every step, the vectors sitting at the lowest PC are executed and the
+    rest are masked out until they are reached again. Vectors that diverged
+    into different loops therefore take turns, and reconverge once they
+    arrive at the same address.
+
+    The final state of every vector is identical to that of `hack.Cpu`
+    running the same program with the same inputs.
+
+    `halts` holds the addresses at which the program is considered halted,
+    see `hack.halt_addresses`.
+    """
+
+    def __init__(
+        self,
+        program: Sequence[int],
+        memory: Optional[Mapping[int, _Values]] = None,
+        count: Optional[int] = None,
+        rom_words: int = hack.ROM_WORDS,
+        ram_words: int = hack.RAM_WORDS,
+    ):
+        """
+        `memory` maps RAM addresses to either a single value, or to an array
+        with a value for each vector. `count` may be omitted if it can be
+        inferred from the arrays.
+        """
+
+        assert rom_words & (rom_words - 1) == 0
+        assert ram_words & (ram_words - 1) == 0
+        assert len(program) <= rom_words
+
+        if not memory:
+            memory = {}
+
+        columns = {
+            address: np.asarray(values, dtype=np.int64)
+            for address, values in memory.items()
+        }
+
+        if count is None:
+            shape = np.broadcast_shapes(*(values.shape for values in columns.values()))
+            if len(shape) != 1:
+                raise ValueError("Cannot infer the number of vectors")
+            count = shape[0]
+
+        self.rom = [int(instruction) & hack.WORD_MASK for instruction in program]
+        self.rom.extend([0] * (rom_words - len(self.rom)))
+
+        self.ram = np.zeros((count, ram_words), dtype=np.int16)
+        for address, values in columns.items():
+            # Store the low 16 bits, regardless of signedness
+            self.ram[:, address] = (
+                (np.broadcast_to(values, (count,)) & hack.WORD_MASK)
+                .astype(np.uint16)
+                .view(np.int16)
+            )
+
+        self._rom_mask = rom_words - 1
+        self._ram_mask = ram_words - 1
+
+        self.halts = hack.halt_addresses(program)
+
+        self.a = np.zeros(count, dtype=np.int16)
+        self.d = np.zeros(count, dtype=np.int16)
+        self.pc = np.zeros(count, dtype=np.int16)
+        self.cycles = np.zeros(count, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.pc)
+
+    @property
+    def halted(self) -> np.ndarray:
+        """
+        Mask of the vectors that reached one of the program's halt addresses.
+        """
+        return np.isin(self.pc, list(self.halts))
+
+    def run(self, cycles: int):
+        """
+        Executes the given number of instructions on every vector.
+        """
+        self._run(cycles, stop_at_halt=False)
+
+    def run_until_halt(self, max_cycles: int) -> np.ndarray:
+        """
+        Executes instructions on every vector until it halts, but no more
+        than `max_cycles` of them. Returns the mask of halted vectors.
+        """
+        self._run(max_cycles, stop_at_halt=True)
+        return self.halted
+
+    def _run(self, cycles: int, stop_at_halt: bool):
+        target = self.cycles + cycles
+
+        while True:
+            active = self.cycles < target
+            if stop_at_halt:
+                active &= ~self.halted
+            if not active.any():
+                break
+
+            pc = int(self.pc[active].min())
+            selected = np.flatnonzero(active & (self.pc == pc))
+
+            self._step(selected, pc)
+
+    def _step(self, selected: np.ndarray, pc: int):
+        """
+        Executes the instruction at `pc` on the selected vectors.
+        """
+
+        instruction = self.rom[pc & self._rom_mask]
+        next_pc = (pc + 1) & hack.ADDRESS_MASK
+
+        self.cycles[selected] += 1
+
+        if not instruction & 0x8000:
+            self.a[selected] = instruction
+            self.pc[selected] = next_pc
+            return
+
+        a = self.a[selected]
+        d = self.d[selected]
+        address = (a & self._ram_mask).astype(np.intp)
+
+        y = self.ram[selected, address] if instruction & 0x1000 else a
+        result = alu(d, y, hack.alu_instruction(instruction))
+
+        if instruction & 0b001000:
+            self.ram[selected, address] = result
+
+        jump = instruction & 0b111
+        if jump == 0b111:
+            self.pc[selected] = a & hack.ADDRESS_MASK
+        elif jump:
+            taken = np.zeros(len(selected), dtype=bool)
+            if jump & 0b001:
+                taken |= result > 0
+            if jump & 0b010:
+                taken |= result == 0
+            if jump & 0b100:
+                taken |= result < 0
+            self.pc[selected] = np.where(taken, a & hack.ADDRESS_MASK, next_pc)
+        else:
+            self.pc[selected] = next_pc
+
+        if instruction & 0b100000:
+            self.a[selected] = result
+        if instruction & 0b010000:
+            self.d[selected] = result
+
+
+def alu(x: np.ndarray, y: np.ndarray, instruction: int) -> np.ndarray:
+    """
+    Vectorized equivalent of `hack.alu`, operating on int16 arrays.
+    """
+
+    extended = (instruction >> 7) & 0b11
+
+    if extended == 0b11:
+        if instruction & 0b100000:  # zx
+            x = np.zeros_like(x)
+        if instruction & 0b010000:  # nx
+            x = ~x
+        if instruction & 0b001000:  # zy
+            y = np.zeros_like(y)
+        if instruction & 0b000100:  # ny
+            y = ~y
+
+        if instruction & 0b000010:  # f
+            result = x + y
+        else:
+            result = x & y
+
+        if instruction & 0b000001:  # no
+            result = ~result
+
+        return result
+
+    if extended == 0b01:
+        operand = x if instruction & 0b010000 else y
+        if instruction & 0b100000:
+            return operand << 1
+        # int16 shifts are arithmetic
+        return operand >> 1
+
+    return x ^ y
@@ -0,0 +1,27 @@
+// Clock generator for the testbenches, for when HDL_CLOCK is defined.
+// Include it in the module body of a testbench with a `clk` output reg.
+//
+// The frequency is +SIM_CLOCK_HZ, or HDL_CLOCK_DEFAULT_HZ if the plusarg
+// isn't given. Without a default, the plusarg is required. The period is
+// 1e9 / clock_hz ns, rounded, the same as util.start_clock would use.
+
+    integer clock_hz;
+    real    half_period_ns;
+
+    initial begin
+        if (!$value$plusargs("SIM_CLOCK_HZ=%d", clock_hz)) begin
+`ifdef HDL_CLOCK_DEFAULT_HZ
+            clock_hz = `HDL_CLOCK_DEFAULT_HZ;
+`else
+            $fatal(1, "+SIM_CLOCK_HZ is required");
+`endif
+        end
+        half_period_ns = $rtoi(1e9 / clock_hz + 0.5) / 2.0;
+
+        clk = 1'b1;
+        forever #(half_period_ns) clk = ~clk;
+    end
+
+`ifdef HDL_CLOCK_DEFAULT_HZ
+`undef HDL_CLOCK_DEFAULT_HZ
+`endif
@@ -1,6 +1,6 @@
 // IO_OUT - holds current LFSR state
 
-@32767  // Replace with MD=D^M (1001000000011000)
+MD=D^M
 M=M>>
 
 // (-IO_OUT[0]) & Taps
@@ -0,0 +1,219 @@
+"""
+Reference model of the Galois LFSR in lfsr.v.
+
+States and taps are plain integers, and a step is exactly what the RTL does
+on every tick:
+
+    state = (state >> 1) ^ taps if state & 1 else state >> 1
+
+The states an LFSR goes through from a given initial state are computed once
+per (state, taps, bits) and cached, so tests just index into them. For wider
+LFSRs, or offsets far into the sequence, `jump` computes the state after any
+number of steps in O(bits**2 log steps), without visiting the states between.
+
+galois is only used to cross-check the model, which can be run as a script:
+
+    python lfsr_model.py 5
+    python lfsr_model.py 8 --taps 0x8E
+"""
+
+import argparse
+import functools
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+class Orbit(NamedTuple):
+    """
+    The states an LFSR goes through, from the initial state `states[0]`
+    up to (not including) the first state that repeats.
+
+    After the last state, the LFSR goes back to `states[loop]`. `loop` is 0
+    unless the taps' MSB is clear, in which case some states have no
+    predecessor, and the LFSR may only reach its cycle after a few steps.
+    """
+
+    states: List[int]
+    loop: int
+
+    @property
+    def period(self) -> int:
+        return len(self.states) - self.loop
+
+    def state(self, steps: int) -> int:
+        """
+        Returns the state after the given number of steps.
+        """
+        if steps >= len(self.states):
+            steps = self.loop + (steps - self.loop) % self.period
+        return self.states[steps]
+
+
+def step(state: int, taps: int) -> int:
+    """
+    Advances the LFSR by a single step.
+    """
+    return (state >> 1) ^ taps if state & 1 else state >> 1
+
+
+@functools.lru_cache(maxsize=None)
+def orbit(state: int, taps: int, bits: int) -> Orbit:
+    """
+    Returns the states an LFSR of width `bits` goes through,
+    starting from `state`.
+
+    Takes up to 2**bits steps, so this is meant for the narrow LFSRs
+    the tests run.
+    """
+
+    mask = (1 << bits) - 1
+    if state & ~mask or taps & ~mask:
+        raise ValueError(f"State 0x{state:X} or taps 0x{taps:X} exceed {bits} bits")
+
+    indices: Dict[int, int] = {}
+    states = []
+    while state not in indices:
+        indices[state] = len(states)
+        states.append(state)
+        state = step(state, taps)
+
+    return Orbit(states, indices[state])
+
+
+def jump(state: int, taps: int, bits: int, steps: int) -> int:
+    """
+    Returns the state after the given number of steps.
+
+    A step is linear over GF(2), so it's a multiplication by the LFSR's
+    companion matrix, and N steps are a multiplication by its N-th power.
+    That power is the product of the matrix's powers of two matching the
+    bits of N, each of which is the square of the previous one.
+    """
+
+    if steps < 0:
+        raise ValueError(f"Can't step the LFSR {steps} times")
+
+    power = 0
+    while steps:
+        if steps & 1:
+            state = _apply(_power_of_two(taps, bits, power), state)
+        steps >>= 1
+        power += 1
+
+    return state
+
+
+@functools.lru_cache(maxsize=None)
+def _power_of_two(taps: int, bits: int, power: int) -> Tuple[int, ...]:
+    """
+    Returns the companion matrix raised to 2**power.
+
+    Matrices are tuples of their columns, each packed into an int, so
+    column j is the state a single step takes the state 1 << j to.
+    """
+
+    if power == 0:
+        return tuple(step(1 << column, taps) for column in range(bits))
+
+    half = _power_of_two(taps, bits, power - 1)
+    return tuple(_apply(half, column) for column in half)
+
+
+def _apply(matrix: Tuple[int, ...], state: int) -> int:
+    """
+    Multiplies the matrix by the state.
+    """
+
+    result = 0
+    for column in matrix:
+        if state & 1:
+            result ^= column
+        state >>= 1
+    return result
+
+
+def cross_check(state: int, taps: int, bits: int, steps: Optional[int] = None):
+    """
+    Checks the model against galois, for the given number of steps
+    (or the whole orbit), and for a few jumps. Raises `AssertionError`
+    on a mismatch.
+
+    A step of the LFSR multiplies the state by x, modulo the polynomial
+    x**bits + taps[0] * x**(bits-1) + ... + taps[bits-1], where bit 0 of the
+    state is the coefficient of x**(bits-1). That holds however a particular
+    version of galois orders the taps of its own LFSR classes.
+    """
+
+    import galois
+
+    def to_poly(value: int) -> "galois.Poly":
+        return galois.Poly(_bits(value, bits), field=galois.GF2)
+
+    def from_poly(poly: "galois.Poly") -> int:
+        coeffs = [int(c) for c in poly.coeffs]
+        coeffs = [0] * (bits - len(coeffs)) + coeffs
+        return sum(bit << i for i, bit in enumerate(coeffs))
+
+    modulus = galois.Poly([1] + _bits(taps, bits), field=galois.GF2)
+    x = galois.Poly([1, 0], field=galois.GF2)
+
+    # Jumps, including ones far past the period
+    for offset in (1, bits, 1 << bits, 2**64 + 1):
+        expected = from_poly((to_poly(state) * pow(x, offset, modulus)) % modulus)
+        actual = jump(state, taps, bits, offset)
+        assert actual == expected, (
+            f"taps=0x{taps:X} state=0x{state:X} jump {offset}: "
+            f"model 0x{actual:X}, galois 0x{expected:X}"
+        )
+
+    reference = orbit(state, taps, bits)
+    if steps is None:
+        steps = len(reference.states) + 1
+
+    current = to_poly(state)
+    for i in range(steps):
+        expected = from_poly(current)
+        assert reference.state(i) == expected, (
+            f"taps=0x{taps:X} state=0x{state:X} step {i}: "
+            f"model 0x{reference.state(i):X}, galois 0x{expected:X}"
+        )
+        current = (current * x) % modulus
+
+
+def _bits(value: int, bits: int) -> List[int]:
+    """
+    Returns the `bits` least significant bits of the value, LSB-first.
+    """
+    return [(value >> i) & 1 for i in range(bits)]
+
+
+def _parse_ints(values: Optional[Iterable[str]]) -> Optional[List[int]]:
+    return None if values is None else [int(value, 0) for value in values]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("bits", type=int, help="Width of the LFSR")
+    parser.add_argument(
+        "--taps",
+        action="append",
+        help="Taps to check (defaults to all of them with the MSB set)",
+    )
+    parser.add_argument(
+        "--state",
+        action="append",
+        help="Initial states to check (defaults to all of them)",
+    )
+    args = parser.parse_args()
+
+    bits: int = args.bits
+    all_taps = _parse_ints(args.taps) or range(1 << (bits - 1), 1 << bits)
+    states = _parse_ints(args.state) or range(1 << bits)
+
+    for taps in all_taps:
+        for state in states:
+            cross_check(state, taps, bits)
+        print(f"0x{taps:X}: OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Catalog of maximal-length LFSR taps, and the periods of LFSR states.
+
+For the Galois LFSR in lfsr.v, a step multiplies the state by x modulo the
+characteristic polynomial
+
+    x**bits + taps[0] * x**(bits-1) + ... + taps[bits-1]
+
+where bit 0 of the state is the coefficient of x**(bits-1). The period of a
+state is then the multiplicative order of x, modulo the part of the
+polynomial the state doesn't cancel out. The taps are maximal-length when the
+polynomial is primitive, i.e. when x has order 2**bits - 1. Nothing here steps
+an LFSR.
+
+The taps of this LFSR are the Koopman-notation values of the reciprocal
+polynomials, which are primitive along with the original ones. So the
+catalog lists the same values as https://users.ece.cmu.edu/~koopman/lfsr/.
+
+The catalog of each width is computed once and kept in a .cache directory
+next to this file. Widths up to FULL_CATALOG_BITS (16) list every
+maximal-length taps value. Wider ones, up to 32 bits and beyond, only list
+the first CATALOG_LIMIT (256) of them, as there are millions.
+
+Only the taps are cached on disk. Their cycle structure needs no storage:
+with maximal-length taps, 0 stays put and every other state has a period of
+2**bits - 1. `period` gives the period of any state with any taps, at any
+width, from polynomial orders. `cycle_structure` gives the counts for all
+states of other taps, but only up to MAX_ENUMERATED_BITS (16), as it goes
+over every state. It's cached in memory only.
+
+Can also be run as a script:
+
+    python lfsr_taps.py 5
+"""
+
+import argparse
+import functools
+import json
+import math
+import os
+import tempfile
+from typing import Dict, List, NamedTuple
+
+# Bump whenever the catalog for the same width may change,
+# to invalidate the cache
+_CACHE_VERSION = 1
+
+CACHE_DIR_NAME = ".cache"
+
+# Widths for which the catalog lists every maximal-length taps value
+FULL_CATALOG_BITS = 16
+
+# Number of taps values listed for wider LFSRs
+CATALOG_LIMIT = 256
+
+# Widths for which `cycle_structure` enumerates every state
+MAX_ENUMERATED_BITS = 16
+
+
+class Catalog(NamedTuple):
+    """
+    Maximal-length taps values for LFSRs of width `bits`, in ascending order.
+
+    `complete` is set if these are all of them.
+    """
+
+    bits: int
+    taps: List[int]
+    complete: bool
+
+    @property
+    def period(self) -> int:
+        """
+        Period of every nonzero state, with any of the taps.
+        """
+        return (1 << self.bits) - 1
+
+
+def catalog(bits: int, cache: bool = True) -> Catalog:
+    """
+    Returns the catalog of maximal-length taps for the given width.
+
+    If `cache` is set, the catalog is kept under a .cache directory next to
+    this file, and only computed the first time.
+
+    Above FULL_CATALOG_BITS, only the first CATALOG_LIMIT taps values are
+    listed, and `complete` is clear.
+    """
+
+    if not cache:
+        return _compute_catalog(bits)
+
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), CACHE_DIR_NAME)
+    cache_path = os.path.join(cache_dir, f"lfsr_taps_v{_CACHE_VERSION}_{bits}.json")
+
+    if os.path.exists(cache_path):
+        with open(cache_path, mode="r", encoding="ASCII") as f:
+            return Catalog(**json.load(f))
+
+    result = _compute_catalog(bits)
+
+    # Several simulations may be computing the same catalog,
+    # so write to a temporary file and move it into place
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode="w", encoding="ASCII") as f:
+            json.dump(result._asdict(), f)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+    return result
+
+
+def _compute_catalog(bits: int) -> Catalog:
+    if bits < 1:
+        raise ValueError(f"Can't have an LFSR of {bits} bits")
+
+    complete = bits <= FULL_CATALOG_BITS
+
+    taps = []
+    for candidate in range(1 << (bits - 1), 1 << bits):
+        if is_maximal(candidate, bits):
+            taps.append(candidate)
+            if not complete and len(taps) == CATALOG_LIMIT:
+                break
+
+    return Catalog(bits, taps, complete)
+
+
+def is_maximal(taps: int, bits: int) -> bool:
+    """
+    Whether the taps make the LFSR go through every nonzero state.
+    """
+
+    _check_width(taps, bits)
+
+    # Without the MSB, the LFSR loses states and never gets them back
+    if not taps & (1 << (bits - 1)):
+        return False
+
+    modulus = _characteristic(taps, bits)
+    order = (1 << bits) - 1
+    if _power_of_x(order, modulus) != 1:
+        return False
+    return all(
+        _power_of_x(order // factor, modulus) != 1 for factor in _prime_factors(order)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def period(state: int, taps: int, bits: int) -> int:
+    """
+    Returns the number of states in the cycle the LFSR ends up in,
+    starting from `state`.
+
+    With the taps' MSB set, the LFSR comes back to `state` itself after that
+    many steps.
+    """
+
+    _check_width(state, bits)
+    _check_width(taps, bits)
+
+    modulus = _characteristic(taps, bits)
+
+    # The state only goes through the cycles of the factors of the polynomial
+    # it doesn't share
+    remaining = _divide(modulus, _gcd(modulus, _reverse(state, bits)))
+
+    # Factors of x only make states fall off into a cycle
+    while remaining and not remaining & 1:
+        remaining >>= 1
+
+    return _order_of_x(remaining)
+
+
+@functools.lru_cache(maxsize=None)
+def cycle_structure(taps: int, bits: int) -> Dict[int, int]:
+    """
+    Maps each period of the LFSR to the number of starting states with that
+    period, as returned by `period`.
+
+    Enumerates every state, so this is limited to MAX_ENUMERATED_BITS,
+    except for maximal-length taps.
+    """
+
+    if is_maximal(taps, bits):
+        return {1: 1, (1 << bits) - 1: (1 << bits) - 1}
+
+    if bits > MAX_ENUMERATED_BITS:
+        raise ValueError(f"Too many states to enumerate for {bits} bits")
+
+    structure: Dict[int, int] = {}
+    for state in range(1 << bits):
+        state_period = period(state, taps, bits)
+        structure[state_period] = structure.get(state_period, 0) + 1
+    return dict(sorted(structure.items()))
+
+
+def _check_width(value: int, bits: int):
+    if bits < 1 or value >> bits:
+        raise ValueError(f"0x{value:X} doesn't fit in {bits} bits")
+
+
+# Polynomials over GF(2) are ints, with bit i holding the coefficient of x**i
+
+
+def _characteristic(taps: int, bits: int) -> int:
+    return (1 << bits) | _reverse(taps, bits)
+
+
+def _reverse(value: int, bits: int) -> int:
+    return int(f"{value:0{bits}b}"[::-1], 2)
+
+
+def _multiply_mod(a: int, b: int, modulus: int) -> int:
+    degree = modulus.bit_length() - 1
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        b >>= 1
+        a <<= 1
+        if a >> degree:
+            a ^= modulus
+    return result
+
+
+def _power_of_x(exponent: int, modulus: int) -> int:
+    """
+    Returns x**exponent modulo the polynomial, which has a degree of at least 1.
+    """
+
+    result = _mod(1, modulus)
+    base = _mod(0b10, modulus)
+    while exponent:
+        if exponent & 1:
+            result = _multiply_mod(result, base, modulus)
+        exponent >>= 1
+        if exponent:
+            base = _multiply_mod(base, base, modulus)
+    return result
+
+
+def _mod(a: int, b: int) -> int:
+    return _divmod(a, b)[1]
+
+
+def _divide(a: int, b: int) -> int:
+    return _divmod(a, b)[0]
+
+
+def _divmod(a: int, b: int):
+    quotient = 0
+    length = b.bit_length()
+    while a.bit_length() >= length:
+        shift = a.bit_length() - length
+        quotient |= 1 << shift
+        a ^= b << shift
+    return quotient, a
+
+
+def _gcd(a: int, b: int) -> int:
+    while b:
+        a, b = b, _mod(a, b)
+    return a
+
+
+@functools.lru_cache(maxsize=None)
+def _order_of_x(modulus: int) -> int:
+    """
+    Returns the smallest N > 0 for which x**N is 1 modulo the polynomial,
+    which must not be divisible by x.
+
+    For a polynomial of degree m, that order divides the lcm of 2**k - 1 for
+    all k up to m (the orders of its irreducible factors), times the power
+    of two that covers the factors' multiplicity. The order is found by
+    dividing the prime factors out of that bound for as long as x**N
+    stays 1.
+    """
+
+    degree = modulus.bit_length() - 1
+    if degree < 1:
+        return 1
+
+    bound = 1
+    factors = set()
+    for k in range(1, degree + 1):
+        bound = bound * ((1 << k) - 1) // math.gcd(bound, (1 << k) - 1)
+        factors.update(_prime_factors((1 << k) - 1))
+    if degree > 1:
+        bound <<= (degree - 1).bit_length()
+        factors.add(2)
+
+    order = bound
+    for factor in factors:
+        while order % factor == 0 and _power_of_x(order // factor, modulus) == 1:
+            order //= factor
+    return order
+
+
+@functools.lru_cache(maxsize=None)
+def _prime_factors(number: int) -> List[int]:
+    """
+    Returns the distinct prime factors of the number, by trial division.
+    """
+
+    factors = []
+    factor = 2
+    while factor * factor <= number:
+        if number % factor == 0:
+            factors.append(factor)
+            while number % factor == 0:
+                number //= factor
+        factor += 1 if factor == 2 else 2
+    if number > 1:
+        factors.append(number)
+    return factors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("bits", type=int, help="Width of the LFSR")
+    args = parser.parse_args()
+
+    result = catalog(args.bits)
+    print(
+        f"{len(result.taps)} maximal-length taps"
+        + ("" if result.complete else " (incomplete)")
+        + f", period {result.period}:"
+    )
+    for taps in result.taps:
+        print(f"  0x{taps:X}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+// Computes RAM[2] = max(RAM[0], RAM[1])
+// Assumes both numbers are non-negative
+
+@R0
+D=M
+@R1
+D=D-M
+@FIRST_IS_GREATER
+D;JGT
+
+@R1
+D=M
+@STORE
+0;JMP
+
+(FIRST_IS_GREATER)
+@R0
+D=M
+
+(STORE)
+@R2
+M=D
+
+(END)
+@END
+0;JMP
@@ -0,0 +1,65 @@
+// Multiplies RAM[0] and RAM[1] and stores the result in RAM[2].
+
+@MAIN
+0;JMP
+
+// Multiplies x by counter, and stores the result in product.
+// Returns to the address in return.
+(MULTIPLY)
+@product
+M=0
+
+// Make sure the counter is non-negative
+@counter
+D=M
+@LOOP
+D;JGE
+@x
+D=!M
+M=D+1
+@counter
+D=!M
+M=D+1
+
+(LOOP)
+@counter
+D=M
+@MULTIPLY_END
+D;JEQ
+@counter
+M=D-1
+@x
+D=M
+@product
+M=D+M
+@LOOP
+0;JMP
+
+(MULTIPLY_END)
+@return
+A=M
+0;JMP
+
+(MAIN)
+@R2
+M=0
+@R0
+D=M
+@x
+M=D
+@R1
+D=M
+@counter
+M=D
+@RETURN
+D=A
+@return
+M=D
+@MULTIPLY
+0;JMP
+
+(RETURN)
+@product
+D=M
+@R2
+M=D
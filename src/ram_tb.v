@@ -13,7 +13,11 @@ module ram_tb #(
     parameter WORD_WIDTH = 8
 `endif
 ) (
+`ifdef HDL_CLOCK
+    output reg                  clk,
+`else
     input                       clk,
+`endif
     input                       reset,
     input  [$clog2(WORDS)-1:0]  address_i,
     input                       wr_en_i,
@@ -21,12 +25,23 @@ module ram_tb #(
     output [WORD_WIDTH-1:0]     data_o
 );
 
+`ifdef CLOCK_HZ
+    localparam CLOCK_HZ = `CLOCK_HZ;
+`else
+    localparam CLOCK_HZ = 6250;
+`endif
+
     initial begin
         $dumpfile ("ram_tb.vcd");
         $dumpvars (0, ram_tb);
         #1;
     end
 
+`ifdef HDL_CLOCK
+`define HDL_CLOCK_DEFAULT_HZ CLOCK_HZ
+`include "hdl_clock.vh"
+`endif
+
     RAM #(
         .WORDS(WORDS),
         .WORD_WIDTH(WORD_WIDTH)
@@ -39,4 +54,30 @@ module ram_tb #(
         .data_o(data_o)
     );
 
+    // Bulk access through hex files ($readmemh format). The memory is
+    // loaded from +RAM_HEX at time zero, and again whenever load_ram
+    // toggles. Toggling dump_ram writes it to +RAM_DUMP. Both names can
+    // also be deposited into the registers below.
+    reg [8*1024-1:0] ram_hex;
+    reg [8*1024-1:0] ram_dump;
+    reg load_ram;
+    reg dump_ram;
+
+    initial begin
+        ram_hex = 0;
+        ram_dump = 0;
+        load_ram = 1'b0;
+        dump_ram = 1'b0;
+
+        if ($value$plusargs("RAM_HEX=%s", ram_hex)) begin
+            $readmemh(ram_hex, ram.memory);
+        end
+        if (!$value$plusargs("RAM_DUMP=%s", ram_dump)) begin
+            ram_dump = 0;
+        end
+    end
+
+    always @(load_ram) if (ram_hex != 0) $readmemh(ram_hex, ram.memory);
+    always @(dump_ram) if (ram_dump != 0) $writememh(ram_dump, ram.memory);
+
 endmodule
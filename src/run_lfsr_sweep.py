@@ -0,0 +1,76 @@
+"""
+Runs test_lfsr_sweep split across several simulator processes.
+
+Each process runs one shard of the configurations, with its own build
+directory and results file:
+
+    python run_lfsr_sweep.py --jobs 4
+
+The processes share tb.vcd, so the waveforms of a sharded run are
+meaningless. Run a single shard to look at them.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from xml.etree import ElementTree
+
+
+def _has_failures(results: str) -> bool:
+    try:
+        tree = ElementTree.parse(results)
+    except (OSError, ElementTree.ParseError):
+        return True
+    return tree.find(".//failure") is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of simulator processes (defaults to the number of CPUs)",
+    )
+    args = parser.parse_args()
+
+    jobs: int = args.jobs
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    results = [
+        os.path.join(directory, f"results_lfsr_sweep_{shard}.xml")
+        for shard in range(jobs)
+    ]
+
+    processes = [
+        subprocess.Popen(
+            [
+                "make",
+                "-C",
+                directory,
+                "sim",
+                "TESTCASE=test_lfsr_sweep",
+                f"LFSR_SWEEP_SHARD={shard}",
+                f"LFSR_SWEEP_SHARDS={jobs}",
+                f"SIM_BUILD=sim_build_lfsr_sweep_{shard}",
+                f"COCOTB_RESULTS_FILE={results[shard]}",
+            ]
+        )
+        for shard in range(jobs)
+    ]
+
+    # make succeeds even if the test fails, so check the results as well
+    failed = [
+        shard
+        for shard, process in enumerate(processes)
+        if process.wait() or _has_failures(results[shard])
+    ]
+    if failed:
+        print(f"Failed shards: {', '.join(map(str, failed))}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+// Sorts the array at address RAM[14], with length specified in RAM[15].
+// In descending order.
+// Values are assumed to be >= 0
+
+@MAIN
+0;JMP
+
+// Insertion sort of the array at address array, with length elements.
+// Returns to the address in return.
+(SORT)
+@i
+M=1
+
+(OUTER_LOOP)
+@i
+D=M
+@length
+D=D-M
+@SORT_END
+D;JGE
+
+// key = array[i]
+@array
+D=M
+@i
+A=D+M
+D=M
+@key
+M=D
+
+@i
+D=M
+@j
+M=D-1
+
+// Move smaller elements one position up
+(INNER_LOOP)
+@j
+D=M
+@INSERT
+D;JLT
+
+// current = array[j]
+@array
+D=M
+@j
+A=D+M
+D=M
+@current
+M=D
+
+@key
+D=D-M
+@INSERT
+D;JGT
+
+// array[j + 1] = current
+@array
+D=M+1
+@j
+D=D+M
+@destination
+M=D
+@current
+D=M
+@destination
+A=M
+M=D
+
+@j
+M=M-1
+@INNER_LOOP
+0;JMP
+
+// array[j + 1] = key
+(INSERT)
+@array
+D=M+1
+@j
+D=D+M
+@destination
+M=D
+@key
+D=M
+@destination
+A=M
+M=D
+
+@i
+M=M+1
+@OUTER_LOOP
+0;JMP
+
+(SORT_END)
+@return
+A=M
+0;JMP
+
+(MAIN)
+@R14
+D=M
+@array
+M=D
+@R15
+D=M
+@length
+M=D
+@END
+D=A
+@return
+M=D
+@SORT
+0;JMP
+
+(END)
@@ -2,7 +2,14 @@
 `timescale 1ns/1ps
 
 module tb (
+`ifdef HDL_CLOCK
+    output reg clk,
+`else
     input clk,
+`endif
+`ifdef PACKED_DATA_IN
+    input [6:0] data_in,
+`else
     input data_in_0,
     input data_in_1,
     input data_in_2,
@@ -10,6 +17,7 @@ module tb (
     input data_in_4,
     input data_in_5,
     input data_in_6,
+`endif
     output [7:0] data_out
 );
 
@@ -19,6 +27,14 @@ module tb (
         #1;
     end
 
+`ifdef HDL_CLOCK
+    // Gate-level simulation has no CLOCK_HZ parameter to default to
+`ifndef GL_TEST
+`define HDL_CLOCK_DEFAULT_HZ mbikovitsky_top.CLOCK_HZ
+`endif
+`include "hdl_clock.vh"
+`endif
+
     mbikovitsky_top
 `ifdef CLOCK_HZ
     #(.CLOCK_HZ(`CLOCK_HZ))
@@ -28,7 +44,11 @@ module tb (
         .vccd1(1'b1),
         .vssd1(1'b0),
 `endif
+`ifdef PACKED_DATA_IN
+        .io_in ({data_in, clk}),
+`else
         .io_in ({data_in_6, data_in_5, data_in_4, data_in_3, data_in_2, data_in_1, data_in_0, clk}),
+`endif
         .io_out (data_out)
     );
 
@@ -1,19 +1,72 @@
 import ctypes
 import os.path
 import random
+import struct
+import sys
 import warnings
+import weakref
+from array import array
 from enum import IntEnum, IntFlag
-from typing import Iterable, List, Union
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import cocotb
 from cocotb.handle import HierarchyObject, ModifiableObject
-from cocotb.triggers import ClockCycles, Edge, Timer, with_timeout
-from galois import GF2, GLFSR
-
+from cocotb.triggers import (
+    ClockCycles,
+    Edge,
+    FallingEdge,
+    First,
+    ReadOnly,
+    Timer,
+    with_timeout,
+)
+from cocotb.utils import get_sim_time
+
+import hack
+import hack_analysis
+import hack_asm
+import hack_stages
+import lfsr_model
+import lfsr_taps
 import util
 
 GATE_LEVEL: bool = "GATE_LEVEL" in cocotb.plusargs
 
+# Fraction of program uploads that go through the UART in RTL simulation.
+# The rest are written straight into the PROM.
+UART_SAMPLE: float = float(cocotb.plusargs.get("SIM_UART_SAMPLE", 0.1))
+
+# Whether the testbench has a single data_in vector instead of data_in_N wires
+PACKED_DATA_IN: bool = "PACKED_DATA_IN" in cocotb.plusargs
+
+# Whether to skip the clocks between LFSR steps by setting its tick counter
+# through the hierarchy (RTL only)
+LFSR_FAST_FORWARD: bool = not GATE_LEVEL and "LFSR_REAL_TICKS" not in cocotb.plusargs
+
+# Part of the configurations test_lfsr_sweep runs, for splitting it
+# across simulator processes
+LFSR_SWEEP_SHARD: int = int(cocotb.plusargs.get("LFSR_SWEEP_SHARD", 0))
+LFSR_SWEEP_SHARDS: int = int(cocotb.plusargs.get("LFSR_SWEEP_SHARDS", 1))
+
+_uart_sampler = random.Random(cocotb.RANDOM_SEED)
+
+# View of the PROM, set up on first use by `_prom`
+_prom_view: Optional[util.MemoryView] = None
+
+# The simulation time of the last write through a `PackedBus` to each vector,
+# and the value written
+_packed_writes: "weakref.WeakKeyDictionary[ModifiableObject, Tuple[int, int]]" = (
+    weakref.WeakKeyDictionary()
+)
+
 
 LFSR_BITS = 5
 
@@ -40,29 +93,87 @@ SEVEN_SEGMENT_DECODER = {
 
 
 class Bus:
+    """
+    A group of input wires, driven and read as a single integer.
+    The first wire holds the least significant bits.
+    """
+
     def __init__(self, wires: Iterable[ModifiableObject]):
-        self._wires = list(wires)
-        self._total_bits = sum(wire.value.n_bits for wire in self._wires)
+        # (wire, offset, mask) for each wire
+        self._fields = []
+        offset = 0
+        for wire in wires:
+            width = wire.value.n_bits
+            self._fields.append((wire, offset, (1 << width) - 1))
+            offset += width
+        self._total_bits = offset
 
     @property
     def value(self) -> int:
-        for wire in self._wires:
-            if not wire.value.is_resolvable:
-                raise ValueError(f"Wire {wire._path} is not resolvable ({wire.value})")
+        result = 0
+        for wire, offset, _ in self._fields:
+            value = wire.value
+            if not value.is_resolvable:
+                raise ValueError(f"Wire {wire._path} is not resolvable ({value})")
+            result |= value.integer << offset
+        return result
 
-        return int("".join(wire.value.binstr for wire in reversed(self._wires)), 2)
+    @value.setter
+    def value(self, value: int):
+        if value < 0:
+            raise NotImplementedError("Negative values are not supported")
+        if value >> self._total_bits:
+            raise ValueError(f"{value} is out of range for this bus")
+
+        for wire, offset, mask in self._fields:
+            wire.value = (value >> offset) & mask
+
+
+class PackedBus:
+    """
+    A range of bits of a single vector input, driven and read as an integer.
+
+    Every write drives the whole vector at once. The bits outside the range
+    keep their current value. Writes only take effect at the end of the time
+    step, so within one step they keep what was last written through any
+    `PackedBus` on the same vector instead, and buses over different bits of
+    it don't step on each other.
+    """
+
+    def __init__(self, vector: ModifiableObject, low: int, width: int = 1):
+        if low < 0 or low + width > vector.value.n_bits:
+            raise ValueError(f"Bits {low}+{width} are out of range for {vector._path}")
+
+        self._vector = vector
+        self._low = low
+        self._mask = ((1 << width) - 1) << low
+
+    @property
+    def value(self) -> int:
+        value = self._vector.value
+        if not value.is_resolvable:
+            raise ValueError(f"{self._vector._path} is not resolvable ({value})")
+        return (value.integer & self._mask) >> self._low
 
     @value.setter
     def value(self, value: int):
         if value < 0:
             raise NotImplementedError("Negative values are not supported")
-        if value >= (1 << self._total_bits):
+        shifted = value << self._low
+        if shifted & ~self._mask:
             raise ValueError(f"{value} is out of range for this bus")
 
-        bit_offset = 0
-        for wire in self._wires:
-            wire.value = (value >> bit_offset) & ((1 << wire.value.n_bits) - 1)
-            bit_offset += wire.value.n_bits
+        now = get_sim_time()
+        written = _packed_writes.get(self._vector)
+        if written is not None and written[0] == now:
+            current = written[1]
+        else:
+            current = self._vector.value
+            current = current.integer if current.is_resolvable else 0
+
+        vector = (current & ~self._mask) | shifted
+        _packed_writes[self._vector] = (now, vector)
+        self._vector.value = vector
 
 
 class AInstruction(ctypes.Union):
@@ -124,18 +235,175 @@ class DestSpec(IntFlag):
     M = 0b001
 
 
+class PromImage:
+    """
+    The bytes that fill the whole PROM over UART: each instruction
+    little-endian, padded with zero words up to the size of the PROM.
+
+    The UART write address wraps around after the last word, so uploading
+    a full image leaves the PROM in the same state as clearing it and then
+    uploading the program, in half the time.
+    """
+
+    def __init__(
+        self,
+        program: Iterable[Union[int, AInstruction, CInstruction]],
+        size: int,
+    ):
+        self._data = bytearray(2 * size)
+
+        if (
+            isinstance(program, array)
+            and program.itemsize == 2
+            and sys.byteorder == "little"
+        ):
+            # Already laid out as the PROM expects, so copy it over as is
+            words = len(program)
+            if words > size:
+                raise ValueError(f"Program of {words} words doesn't fit in {size}")
+            self._data[: 2 * words] = memoryview(program).cast("B")
+        else:
+            instructions = [int(instruction) for instruction in program]
+            words = len(instructions)
+            if words > size:
+                raise ValueError(f"Program of {words} words doesn't fit in {size}")
+            struct.pack_into(f"<{words}H", self._data, 0, *instructions)
+
+        self._program_words = words
+
+    def __len__(self) -> int:
+        return len(self._data) // 2
+
+    @property
+    def program_words(self) -> int:
+        """
+        Number of words at the start of the image that came from the program.
+        """
+        return self._program_words
+
+    @property
+    def data(self) -> memoryview:
+        """
+        The whole image, padding included.
+        """
+        return memoryview(self._data).toreadonly()
+
+    @property
+    def program_data(self) -> memoryview:
+        """
+        Just the program, without the padding.
+        """
+        return self.data[: 2 * self._program_words]
+
+    def words(self) -> List[int]:
+        return list(struct.unpack(f"<{len(self)}H", self._data))
+
+
 @cocotb.test()
 async def test_maximal_length(dut: HierarchyObject):
-    # https://users.ece.cmu.edu/~koopman/lfsr/5.txt
-    taps = random.choice([0x12, 0x14, 0x17, 0x1B, 0x1D, 0x1E])
+    catalog = lfsr_taps.catalog(LFSR_BITS)
+    taps = random.choice(catalog.taps)
 
     encountered = await _test_lfsr(dut, _random_initial_state(), taps)
-    assert len(encountered) == 2**LFSR_BITS - 1
+    assert len(encountered) == catalog.period
 
 
 @cocotb.test()
 async def test_random_taps(dut: HierarchyObject):
-    await _test_lfsr(dut, _random_initial_state(), _random_taps())
+    initial_state = _random_initial_state()
+    taps = _random_taps()
+
+    encountered = await _test_lfsr(dut, initial_state, taps)
+    assert len(encountered) == lfsr_taps.period(initial_state, taps, LFSR_BITS)
+
+
+@cocotb.test(skip=not LFSR_FAST_FORWARD)
+async def test_lfsr_sweep(dut: HierarchyObject):
+    """
+    Runs every taps value `_random_taps` may return with every nonzero
+    initial state, or the shard of those selected by LFSR_SWEEP_SHARD
+    out of LFSR_SWEEP_SHARDS.
+    """
+
+    configurations = [
+        (taps, initial_state)
+        for taps in range(2 ** (LFSR_BITS - 1), 2**LFSR_BITS)
+        for initial_state in range(1, 2**LFSR_BITS)
+    ]
+
+    _start_clock(dut)
+
+    periods: Dict[int, Dict[int, int]] = {}
+    for taps, initial_state in configurations[LFSR_SWEEP_SHARD::LFSR_SWEEP_SHARDS]:
+        encountered = await _check_lfsr(dut, initial_state, taps)
+
+        expected_period = lfsr_taps.period(initial_state, taps, LFSR_BITS)
+        assert len(encountered) == expected_period, (
+            f"taps=0x{taps:02X} state=0x{initial_state:02X}: "
+            f"period {len(encountered)}, expected {expected_period}"
+        )
+
+        counts = periods.setdefault(taps, {})
+        counts[expected_period] = counts.get(expected_period, 0) + 1
+
+    for taps, counts in periods.items():
+        summary = ", ".join(
+            f"{count} with period {period}" for period, count in sorted(counts.items())
+        )
+        dut._log.info(f"taps=0x{taps:02X}: {summary}")
+
+
+@cocotb.test(skip=not LFSR_FAST_FORWARD)
+async def test_lfsr_jump(dut: HierarchyObject):
+    """
+    Checks the DUT's state at sampled tick offsets against
+    `lfsr_model.jump`, without comparing the states in between.
+    """
+
+    initial_state = _random_initial_state()
+    taps = random.choice(lfsr_taps.catalog(LFSR_BITS).taps)
+
+    # The jumps themselves against plain stepping
+    for state in range(2**LFSR_BITS):
+        expected = state
+        for steps in range(2 ** (LFSR_BITS + 1)):
+            assert lfsr_model.jump(state, taps, LFSR_BITS, steps) == expected, (
+                f"taps=0x{taps:02X} state=0x{state:02X}: jump {steps} "
+                f"doesn't match stepping"
+            )
+            expected = lfsr_model.step(expected, taps)
+
+    _start_clock(dut)
+
+    await _reset_lfsr(dut, initial_state, taps)
+
+    fast_forward = cocotb.start_soon(_fast_forward_lfsr(dut))
+    try:
+        # The LFSR steps on every clock from now on, but the first step may
+        # come up to a clock late. A maximal-length LFSR always changes
+        # state, so the first edge of the output marks tick 1.
+        await with_timeout(Edge(dut.data_out), round(1e9 / _clock_hz(dut)) * 3, "ns")
+        ticks = 1
+
+        # Skip ahead by a few periods at a time
+        for _ in range(8):
+            skip = random.randint(1, 4 * 2**LFSR_BITS)
+            await ClockCycles(dut.clk, skip)
+            ticks += skip
+
+            await ReadOnly()
+
+            state = _seven_segment_to_number(dut.data_out.value.integer)
+            expected = lfsr_model.jump(initial_state, taps, LFSR_BITS, ticks)
+            assert state == expected, (
+                f"taps=0x{taps:02X} state=0x{initial_state:02X} tick {ticks}: "
+                f"DUT 0x{state:02X}, model 0x{expected:02X}"
+            )
+    finally:
+        fast_forward.kill()
+
+    # Leave the read-only phase before the next test drives the inputs
+    await FallingEdge(dut.clk)
 
 
 @cocotb.test()
@@ -152,15 +420,13 @@ async def test_upload_program(dut: HierarchyObject):
 
     program = [random.randint(0x0000, 0xFFFF) for _ in range(_prom_size(dut))]
 
-    await _upload_program(dut, program)
+    await _upload_program(dut, program, uart=True)
 
 
 @cocotb.test()
 async def test_io_out(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     value = random.randint(0x0000, 0x7FFF)
 
     program = [
@@ -171,9 +437,9 @@ async def test_io_out(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=1, comp=0b110111),  # M=M+1
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) + 1)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == ((value + 1) & 0xFF)
@@ -183,8 +449,6 @@ async def test_io_out(dut: HierarchyObject):
 async def test_add(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     x = random.randint(0x0000, 0x7FFF)
     y = random.randint(0x0000, 0x7FFF)
 
@@ -195,9 +459,9 @@ async def test_add(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=0, comp=0b000010),  # M=D+A
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == ((x + y) & 0xFF)
@@ -207,8 +471,6 @@ async def test_add(dut: HierarchyObject):
 async def test_sub(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     x = random.randint(0x0000, 0x7FFF)
     y = random.randint(0x0000, 0x7FFF)
 
@@ -219,9 +481,9 @@ async def test_sub(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=0, comp=0b010011),  # M=D-A
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == ((x - y) & 0xFF)
@@ -231,8 +493,6 @@ async def test_sub(dut: HierarchyObject):
 async def test_and(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     x = random.randint(0x0000, 0x7FFF)
     y = random.randint(0x0000, 0x7FFF)
 
@@ -243,9 +503,9 @@ async def test_and(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=0, comp=0b000000),  # M=D&A
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == ((x & y) & 0xFF)
@@ -255,8 +515,6 @@ async def test_and(dut: HierarchyObject):
 async def test_or(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     x = random.randint(0x0000, 0x7FFF)
     y = random.randint(0x0000, 0x7FFF)
 
@@ -267,9 +525,9 @@ async def test_or(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=0, comp=0b010101),  # M=D|A
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == ((x | y) & 0xFF)
@@ -279,8 +537,6 @@ async def test_or(dut: HierarchyObject):
 async def test_xor(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     x = random.randint(0x0000, 0x7FFF)
     y = random.randint(0x0000, 0x7FFF)
 
@@ -291,9 +547,9 @@ async def test_xor(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, extended=0b00, a=0, comp=0b000000),  # M=D^A
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == ((x ^ y) & 0xFF)
@@ -303,8 +559,6 @@ async def test_xor(dut: HierarchyObject):
 async def test_not(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     x = random.randint(0x0000, 0x7FFF)
 
     program = [
@@ -312,9 +566,9 @@ async def test_not(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=0, comp=0b110001),  # M=!A
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == ((~x) & 0xFF)
@@ -324,8 +578,6 @@ async def test_not(dut: HierarchyObject):
 async def test_neg(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     x = random.randint(0x0000, 0x7FFF)
 
     program = [
@@ -333,9 +585,9 @@ async def test_neg(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=0, comp=0b110011),  # M=-A
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == ((-x) & 0xFF)
@@ -345,15 +597,13 @@ async def test_neg(dut: HierarchyObject):
 async def test_zero(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     program = [
         CInstruction(dest=DestSpec.M, a=0, comp=0b101010),  # M=0
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == 0
@@ -363,15 +613,13 @@ async def test_zero(dut: HierarchyObject):
 async def test_one(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     program = [
         CInstruction(dest=DestSpec.M, a=0, comp=0b111111),  # M=1
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == 1
@@ -381,15 +629,13 @@ async def test_one(dut: HierarchyObject):
 async def test_minus_one(dut: HierarchyObject):
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     program = [
         CInstruction(dest=DestSpec.M, a=0, comp=0b111010),  # M=-1
     ]
 
-    await _upload_program(dut, program)
+    await _prepare_cpu(dut, program)
 
-    await _run_cpu(dut, len(program) * 3)
+    await _run_cpu(dut, hack_analysis.cycle_bound(program) + 1)
 
     # Only the lower 8 bits are actually output
     assert dut.data_out.value.integer == 0xFF
@@ -397,13 +643,11 @@ async def test_minus_one(dut: HierarchyObject):
 
 @cocotb.test()
 async def test_multi_stage(dut: HierarchyObject):
-    cpu_reset = dut.data_in_2
-    mem_reset = dut.data_in_3
+    cpu_reset = _data_in(dut, 2)
+    mem_reset = _data_in(dut, 3)
 
     _start_clock(dut)
 
-    await _enter_cpu_mode(dut)
-
     x = random.randint(0x0000, 0x7FFF)
 
     first_stage = [
@@ -411,12 +655,12 @@ async def test_multi_stage(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=0, comp=0b110011),  # M=-A
     ]
 
-    await _upload_program(dut, first_stage)
+    await _prepare_cpu(dut, first_stage)
 
     # Run first stage
     cpu_reset.value = 0
     mem_reset.value = 0
-    await ClockCycles(dut.clk, len(first_stage) * 3)
+    await ClockCycles(dut.clk, hack_analysis.cycle_bound(first_stage) + 1)
 
     assert dut.data_out.value.integer == (-x) & 0xFF
 
@@ -434,20 +678,61 @@ async def test_multi_stage(dut: HierarchyObject):
 
         # Run second stage
         cpu_reset.value = 0
-        await ClockCycles(dut.clk, len(second_stage) * 3)
+        await ClockCycles(dut.clk, hack_analysis.cycle_bound(second_stage) + 1)
 
         assert dut.data_out.value.integer == ((-x) >> (i * 2)) & 0xFF
 
 
-@cocotb.test(skip=True)
-async def test_lfsr_program(dut: HierarchyObject):
-    cpu_reset = dut.data_in_2
-    mem_reset = dut.data_in_3
+@cocotb.test()
+async def test_staged_program(dut: HierarchyObject):
+    mem_reset = _data_in(dut, 3)
 
     _start_clock(dut)
 
     await _enter_cpu_mode(dut)
 
+    count = random.randint(2, 5)
+    value = random.randint(0x0000, 0x7FFF)
+
+    # Longer than the PROM, with a loop that carries D across stages
+    source = f"""
+        @{value}
+        D=A
+        M=D
+        @{count}
+        D=A
+        (LOOP)
+        M=M<<
+        M=M+1
+        D=D-1
+        @LOOP
+        D;JGT
+        M=M^D
+        (END)
+        @END
+        0;JMP
+    """
+    program = hack_asm.assemble(source)
+
+    reference = hack.Cpu(program, ram_words=hack_stages.TOP_RAM_WORDS)
+    assert reference.run_until_halt(1000)
+
+    mem_reset.value = 0
+
+    stages = await _run_stages(dut, program)
+    assert len(stages) > 1
+
+    # Only the lower 8 bits are actually output
+    assert dut.data_out.value.integer == reference.ram[0] & 0xFF
+
+
+@cocotb.test(skip=True)
+async def test_lfsr_program(dut: HierarchyObject):
+    cpu_reset = _data_in(dut, 2)
+    mem_reset = _data_in(dut, 3)
+
+    _start_clock(dut)
+
     init_program = [
         AInstruction(address=1),  # Initial state
         CInstruction(dest=DestSpec.D, a=0, comp=0b110000),  # D=A
@@ -455,19 +740,18 @@ async def test_lfsr_program(dut: HierarchyObject):
         CInstruction(dest=DestSpec.M, a=0, comp=0b001100),  # M=D
     ]
 
-    await _upload_program(dut, init_program)
+    await _prepare_cpu(dut, init_program)
 
     # Run the initialization
     cpu_reset.value = 0
     mem_reset.value = 0
-    await ClockCycles(dut.clk, len(init_program) + 1)
+    await ClockCycles(dut.clk, hack_analysis.cycle_bound(init_program) + 1)
 
     assert dut.data_out.value.integer == 1
 
-    with open(
-        os.path.join(os.path.dirname(__file__), "lfsr.hack"), mode="r", encoding="ASCII"
-    ) as f:
-        program = [int(line, 2) for line in f]
+    program = hack_asm.assemble_file(
+        os.path.join(os.path.dirname(__file__), "lfsr.asm")
+    )
 
     cpu_reset.value = 1
 
@@ -502,97 +786,100 @@ async def test_lfsr_program(dut: HierarchyObject):
     # Wait for all outputs.
     outputs = await with_timeout(collect_outputs(), 300, "sec")
 
-    lfsr_reference = GLFSR.Taps(
-        taps=GF2(_bits_list(0x8E, 8)),
-        state=_bits_list(1, 8),
-    )
-
-    expected_outputs = []
-    for _ in range(len(outputs)):
-        expected_outputs.append(
-            int("".join(str(int(x)) for x in lfsr_reference.state), 2)
-        )
-        lfsr_reference.step()
+    lfsr_reference = lfsr_model.orbit(1, 0x8E, 8)
+    expected_outputs = [lfsr_reference.state(i) for i in range(len(outputs))]
 
     assert outputs == expected_outputs
 
 
-async def _enter_cpu_mode(dut: HierarchyObject):
+async def _enter_cpu_mode(dut: HierarchyObject, settle: bool = True):
     """
     Puts the DUT into "CPU mode".
 
-    CPU and memory are in reset when this function returns.
+    CPU and memory are in reset when this function returns, unless `settle`
+    is cleared. Then it only drives the inputs, and the caller has to wait
+    for a clock before relying on the resets.
     """
 
-    reset_lfsr = dut.data_in_0
-    reset_taps = dut.data_in_1
+    reset_lfsr = _data_in(dut, 0)
+    reset_taps = _data_in(dut, 1)
     reset_lfsr.value = reset_taps.value = 1
 
-    cpu_reset = dut.data_in_2
+    cpu_reset = _data_in(dut, 2)
     cpu_reset.value = 1
 
-    mem_reset = dut.data_in_3
+    mem_reset = _data_in(dut, 3)
     mem_reset.value = 1
 
-    uart_reset = dut.data_in_5
+    uart_reset = _data_in(dut, 5)
     uart_reset.value = 1
 
-    uart_rx = dut.data_in_4
+    uart_rx = _data_in(dut, 4)
     uart_rx.value = 1  # Make sure the UART doesn't do anything
 
-    await ClockCycles(dut.clk, 2)
+    if settle:
+        await ClockCycles(dut.clk, 2)
 
 
-async def _upload_program(
+async def _prepare_cpu(
     dut: HierarchyObject, program: Iterable[Union[int, AInstruction, CInstruction]]
 ):
     """
-    Uploads a program to the CPU PROM via UART.
+    Puts the DUT into CPU mode with the given program in the PROM,
+    and the CPU and memory in reset.
 
-    The CPU should be in reset before running this function.
+    This is `_enter_cpu_mode` followed by `_upload_program`. When the program
+    is written into the PROM directly, the write already waits a clock for
+    the resets, so entering CPU mode doesn't wait for them separately.
     """
 
-    program = [int(instruction) for instruction in program]
-    assert len(program) <= _prom_size(dut)
+    uart = GATE_LEVEL or _uart_sampler.random() < UART_SAMPLE
 
-    program_bytes = b"".join(
-        instruction.to_bytes(2, byteorder="little", signed=False)
-        for instruction in program
-    )
+    await _enter_cpu_mode(dut, settle=uart)
+    await _upload_program(dut, program, uart=uart)
 
-    uart_rx = dut.data_in_4
-    uart_reset = dut.data_in_5
 
-    assert uart_rx.value.integer == 1
+async def _upload_program(
+    dut: HierarchyObject,
+    program: Iterable[Union[int, AInstruction, CInstruction]],
+    clear: bool = True,
+    uart: Optional[bool] = None,
+):
+    """
+    Uploads a program to the CPU PROM.
 
-    uart_reset.value = 0
-    await ClockCycles(dut.clk, 2)
+    If `clear` is set, the rest of the PROM is zeroed as well. Otherwise,
+    whatever was there after the program is kept.
 
-    # Clear PROM
-    await util.uart_send(uart_rx, _baud_rate(dut), b"\x00\x00" * _prom_size(dut))
-    await util.uart_send(uart_rx, _baud_rate(dut), program_bytes)
+    The program goes through the UART if `uart` is set. By default, that's
+    the case in gate-level simulation, and for a random `UART_SAMPLE` of the
+    uploads otherwise. The rest are written into the PROM directly, which
+    takes a couple of cycles instead of 20 bit times per instruction.
 
-    # Wait for last write to propagate
-    await ClockCycles(dut.clk, 2)
+    The CPU should be in reset before running this function.
+    """
 
-    uart_reset.value = 1
+    image = PromImage(program, _prom_size(dut))
+
+    if uart is None:
+        uart = GATE_LEVEL or _uart_sampler.random() < UART_SAMPLE
+
+    if uart:
+        await _send_prom_image(dut, image, clear)
+    else:
+        await _write_prom_image(dut, image, clear)
 
     if GATE_LEVEL:
         # We can't easily get the PROM contents in gate-level simulation.
         return
 
-    # Enumerate PROM contents explicitly from low address to high.
-    # (Arrays in cocotb are iterated from left to right, which may actually
-    # be high-to-low, depending on the Verilog definition.)
-    prom = [dut.mbikovitsky_top.prom.value[i].integer for i in range(_prom_size(dut))]
+    expected = image.words()
+    if not clear:
+        expected = expected[: image.program_words]
 
-    if prom[: len(program)] == program:
-        return
+    prom = (await _prom(dut))[: len(expected)]
 
-    prom.reverse()
-
-    if prom[: len(program)] == program:
-        warnings.warn("Arrays are reversed in this simulator")
+    if prom == expected:
         return
 
     dut._log.info("PROM contents:")
@@ -600,15 +887,131 @@ async def _upload_program(
         dut._log.info(f"0x{i:X} - 0x{value:X}")
 
     dut._log.info("Expected contents:")
-    for i, value in enumerate(program):
+    for i, value in enumerate(expected):
         dut._log.info(f"0x{i:X} - 0x{value:X}")
 
     assert False
 
 
+async def _send_prom_image(dut: HierarchyObject, image: PromImage, clear: bool):
+    """
+    Uploads a PROM image via UART. See `_upload_program`.
+    """
+
+    uart_rx = _data_in(dut, 4)
+    uart_reset = _data_in(dut, 5)
+
+    assert uart_rx.value == 1
+
+    uart_reset.value = 0
+    await ClockCycles(dut.clk, 2)
+
+    await util.uart_send(
+        uart_rx, _baud_rate(dut), image.data if clear else image.program_data
+    )
+
+    # Wait for last write to propagate
+    await ClockCycles(dut.clk, 2)
+
+    uart_reset.value = 1
+
+
+async def _write_prom_image(dut: HierarchyObject, image: PromImage, clear: bool):
+    """
+    Writes a PROM image straight into the PROM array, bypassing the UART.
+    RTL simulation only. See `_upload_program`.
+    """
+
+    assert not GATE_LEVEL
+
+    # Give the CPU reset a cycle to take effect, as callers may release it
+    # right after this returns
+    await ClockCycles(dut.clk, 1)
+
+    prom = await _prom(dut)
+
+    words = image.words()
+    if not clear:
+        words = words[: image.program_words]
+    prom[: len(words)] = words
+
+    # Let the writes land
+    await ClockCycles(dut.clk, 1)
+
+
+async def _prom(dut: HierarchyObject) -> util.MemoryView:
+    """
+    Returns a view of the PROM. RTL simulation only.
+
+    The first call finds out the orientation of the array: the CPU fetches
+    from address 0 while it's in reset, so the CPU should be in reset.
+    """
+
+    global _prom_view
+
+    if _prom_view is None:
+        view = util.MemoryView(dut.mbikovitsky_top.prom)
+
+        # Make sure the reset took effect
+        await ClockCycles(dut.clk, 1)
+
+        await view.detect_orientation(
+            dut.mbikovitsky_top.instruction, FallingEdge(dut.clk)
+        )
+        assert dut.mbikovitsky_top.next_instruction_addr.value.integer == 0
+
+        if view.reversed:
+            warnings.warn("PROM handle indices are reversed in this simulator")
+
+        _prom_view = view
+
+    return _prom_view
+
+
+async def _run_stages(
+    dut: HierarchyObject, program: Sequence[int], memory: int = 0
+) -> List[hack_stages.Stage]:
+    """
+    Runs a program that may be larger than the PROM, by splitting it into
+    stages (see `hack_stages`). Each stage is uploaded and run for exactly
+    as long as it takes, with `cpu_io_out` carrying the state between them.
+
+    The CPU should be in reset, and the memory out of reset and holding
+    `memory`, before running this function. The CPU is in reset again when
+    it returns.
+    """
+
+    cpu_reset = _data_in(dut, 2)
+
+    # Each instruction is sent as two 8N1 bytes
+    word_cost = 2 * 10 * _clock_hz(dut) / _baud_rate(dut)
+
+    stages = hack_stages.plan(
+        list(program),
+        rom_words=_prom_size(dut),
+        word_cost=word_cost,
+        # Toggling the UART and CPU resets
+        stage_cost=6,
+        memory=memory,
+    )
+
+    for stage in stages:
+        cpu_reset.value = 1
+        await _upload_program(dut, stage.program, clear=False)
+
+        cpu_reset.value = 0
+        await ClockCycles(dut.clk, stage.cycles)
+        cpu_reset.value = 1
+
+    # Let the last write show up on the outputs
+    await ClockCycles(dut.clk, 1)
+
+    return stages
+
+
 async def _run_cpu(dut: HierarchyObject, cycles: int):
-    cpu_reset = dut.data_in_2
-    mem_reset = dut.data_in_3
+    cpu_reset = _data_in(dut, 2)
+    mem_reset = _data_in(dut, 3)
 
     # Reset the CPU
     cpu_reset.value = 1
@@ -625,22 +1028,75 @@ async def _test_lfsr(dut: HierarchyObject, initial_state: int, taps: int):
     """
     Exercises the DUT with the given initial state and taps.
 
-    Verifies that the output is as expected, and returns a set of all
-    encountered outputs.
+    Verifies that every change of the output is the next state of the
+    reference model, and returns a set of all encountered outputs.
     """
 
     _start_clock(dut)
+    return await _check_lfsr(dut, initial_state, taps)
 
-    lfsr_reference = GLFSR.Taps(
-        taps=GF2(_bits_list(taps, LFSR_BITS)),
-        state=_bits_list(initial_state, LFSR_BITS),
-    )
 
-    reset_lfsr = dut.data_in_0
-    reset_taps = dut.data_in_1
-    data_in = Bus(
-        [dut.data_in_2, dut.data_in_3, dut.data_in_4, dut.data_in_5, dut.data_in_6]
-    )
+async def _check_lfsr(dut: HierarchyObject, initial_state: int, taps: int):
+    """
+    Same as `_test_lfsr`, with the clock already running.
+    """
+
+    lfsr_reference = lfsr_model.orbit(initial_state, taps, LFSR_BITS)
+
+    state = await _reset_lfsr(dut, initial_state, taps)
+
+    encountered = {state}
+
+    fast_forward = None
+    if LFSR_FAST_FORWARD:
+        fast_forward = cocotb.start_soon(_fast_forward_lfsr(dut))
+        ticks = 1
+    else:
+        ticks = _clock_hz(dut)
+
+    # The first tick may come up to a clock late, depending on when the
+    # reset was released
+    timeout = round(1e9 / _clock_hz(dut)) * (ticks + 2)
+
+    try:
+        for step in range(1, 2**LFSR_BITS):
+            expected_state = lfsr_reference.state(step)
+
+            if expected_state == state:
+                # The LFSR is stuck, and should stay that way
+                edge = Edge(dut.data_out)
+                timer = Timer(timeout, units="ns")
+                assert await First(edge, timer) is timer
+                break
+
+            await with_timeout(Edge(dut.data_out), timeout, "ns")
+
+            # Let the gates settle
+            await ReadOnly()
+
+            state = _seven_segment_to_number(dut.data_out.value.integer)
+            assert state == expected_state
+
+            encountered.add(state)
+    finally:
+        if fast_forward is not None:
+            fast_forward.kill()
+
+    # Leave the read-only phase, so the caller can drive the inputs again
+    await FallingEdge(dut.clk)
+
+    return encountered
+
+
+async def _reset_lfsr(dut: HierarchyObject, initial_state: int, taps: int) -> int:
+    """
+    Loads the taps and the initial state into the LFSR, and releases its
+    reset right after a rising edge. Returns the state it shows.
+    """
+
+    reset_lfsr = _data_in(dut, 0)
+    reset_taps = _data_in(dut, 1)
+    data_in = _data_in(dut, 2, LFSR_BITS)
 
     reset_taps.value = 1
     data_in.value = taps
@@ -654,31 +1110,46 @@ async def _test_lfsr(dut: HierarchyObject, initial_state: int, taps: int):
     assert data_in.value == initial_state
     reset_lfsr.value = 0
 
-    encountered = set()
+    state = _seven_segment_to_number(dut.data_out.value.integer)
+    assert state == initial_state
 
-    for _ in range(2**LFSR_BITS):
-        await Timer(1, units="sec")
+    return state
 
-        expected_state = int("".join(str(int(x)) for x in lfsr_reference.state), 2)
 
-        state = _seven_segment_to_number(dut.data_out.value.integer)
+async def _fast_forward_lfsr(dut: HierarchyObject):
+    """
+    Makes the LFSR step on every clock, instead of once every TICKS clocks,
+    by setting its tick counter to the last tick before each rising edge.
+    """
 
-        assert state == expected_state
+    lfsr = dut.mbikovitsky_top.lfsr
+    last_tick = lfsr.TICKS.value - 1
 
-        encountered.add(expected_state)
+    falling_edge = FallingEdge(dut.clk)
+    while True:
+        await falling_edge
+        lfsr.tick_count.value = last_tick
 
-        lfsr_reference.step()
 
-    return encountered
+def _start_clock(dut: HierarchyObject):
+    util.start_clock(dut, _clock_hz(dut))
 
 
-def _start_clock(dut: HierarchyObject):
-    clock_hz = (
+def _data_in(dut: HierarchyObject, first: int, count: int = 1) -> Union[Bus, PackedBus]:
+    """
+    Returns a bus over `count` of the DUT's data inputs, starting at `first`.
+    """
+    if PACKED_DATA_IN:
+        return PackedBus(dut.data_in, first, count)
+    return Bus(getattr(dut, f"data_in_{i}") for i in range(first, first + count))
+
+
+def _clock_hz(dut: HierarchyObject) -> int:
+    return (
         int(cocotb.plusargs["SIM_CLOCK_HZ"])
         if GATE_LEVEL or "SIM_CLOCK_HZ" in cocotb.plusargs
         else dut.mbikovitsky_top.CLOCK_HZ.value
     )
-    util.start_clock(dut, clock_hz)
 
 
 def _baud_rate(dut: HierarchyObject) -> int:
@@ -711,22 +1182,6 @@ def _random_taps() -> int:
     return random.randint(2 ** (LFSR_BITS - 1), 2**LFSR_BITS - 1)
 
 
-def _bits_list(number: int, bits: int) -> List[int]:
-    """
-    Returns a list of the `bits` least significant bits in the given number.
-
-    The list is returned MSB-first.
-    """
-    return list(reversed([_get_bit(number, i) for i in range(bits)]))
-
-
-def _get_bit(number: int, bit: int) -> int:
-    """
-    Returns bit `bit`, counting from the LSB, of the number.
-    """
-    return (number >> bit) & 1
-
-
 def _seven_segment_to_number(bits: int):
     """
     Decodes the seven-segment display output of the DUT.
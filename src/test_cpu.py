@@ -1,11 +1,19 @@
 import ctypes
+import os.path
 import random
-from typing import Mapping, Optional, Sequence
+import tempfile
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
 
 import cocotb
+import numpy as np
 from cocotb.handle import HierarchyObject
-from cocotb.triggers import ClockCycles
+from cocotb.triggers import ClockCycles, FallingEdge, ReadOnly, RisingEdge
 
+import hack
+import hack_analysis
+import hack_asm
+import hack_opt
+import hack_vector
 import util
 
 CLOCK_HZ = 6250
@@ -13,323 +21,264 @@ CLOCK_HZ = 6250
 VAL_MIN = -32768
 VAL_MAX = 32767
 
+# Number of random inputs to check on the vectorized model
+# before picking the ones to simulate
+SCREEN_VECTORS = 4096
 
-# Computes RAM[0] = 2 + 3
-ADD = [
-    0b0000000000000010,
-    0b1110110000010000,
-    0b0000000000000011,
-    0b1110000010010000,
-    0b0000000000000000,
-    0b1110001100001000,
-]
-
-# Computes RAM[2] = max(RAM[0], RAM[1])
-# Assumes both numbers are non-negative
-MAX = [
-    0b0000000000000000,
-    0b1111110000010000,
-    0b0000000000000001,
-    0b1111010011010000,
-    0b0000000000001010,
-    0b1110001100000001,
-    0b0000000000000001,
-    0b1111110000010000,
-    0b0000000000001100,
-    0b1110101010000111,
-    0b0000000000000000,
-    0b1111110000010000,
-    0b0000000000000010,
-    0b1110001100001000,
-    0b0000000000001110,
-    0b1110101010000111,
-]
-
-# Computes RAM[13]/RAM[14] and stores the result in RAM[15].
-# The remainder is discarded.
-# It is assumed that both numbers are > 0.
-DIVIDE = [
-    0b0000000000111000,
-    0b1110101010000111,
-    0b0000000000010000,
-    0b1111110000010000,
-    0b0000000000010001,
-    0b1110001100001000,
-    0b0000000000010001,
-    0b1111110000010000,
-    0b0000000000010010,
-    0b1111010011010000,
-    0b0000000000010000,
-    0b1110001100000001,
-    0b0000000000010001,
-    0b1011100000001000,
-    0b0000000000000110,
-    0b1110101010000111,
-    0b0111111111111111,
-    0b1110110000010000,
-    0b0000000000010001,
-    0b1011000000001000,
-    0b1111000000001000,
-    0b0000000000010011,
-    0b1110101010001000,
-    0b0000000000010001,
-    0b1111110000010000,
-    0b0000000000010000,
-    0b1111010011010000,
-    0b0000000000110001,
-    0b1110001100000100,
-    0b0000000000010011,
-    0b1011100000001000,
-    0b0000000000010010,
-    0b1111110000010000,
-    0b0000000000010001,
-    0b1111010011010000,
-    0b0000000000101101,
-    0b1110001100000100,
-    0b0000000000010011,
-    0b1111110111001000,
-    0b0000000000010010,
-    0b1111110000010000,
-    0b0000000000010001,
-    0b1111010011010000,
-    0b0000000000010010,
-    0b1110001100001000,
-    0b0000000000010001,
-    0b1011000000001000,
-    0b0000000000010111,
-    0b1110101010000111,
-    0b0000000000010011,
-    0b1111110000010000,
-    0b0000000000010100,
-    0b1110001100001000,
-    0b0000000000010101,
-    0b1111110000100000,
-    0b1110101010000111,
-    0b0000000000001101,
-    0b1111110000010000,
-    0b0000000000010010,
-    0b1110001100001000,
-    0b0000000000001110,
-    0b1111110000010000,
-    0b0000000000010000,
-    0b1110001100001000,
-    0b0000000001000110,
-    0b1110110000010000,
-    0b0000000000010101,
-    0b1110001100001000,
-    0b0000000000000010,
-    0b1110101010000111,
-    0b0000000000010100,
-    0b1111110000010000,
-    0b0000000000001111,
-    0b1110001100001000,
-]
-
-# Sorts the array at address RAM[14], with length specified in RAM[15].
-# In descending order.
-# Values are assumed to be >= 0
-SORT = [
-    0b0000000001000101,
-    0b1110101010000111,
-    0b0000000000010000,
-    0b1110111111001000,
-    0b0000000000010000,
-    0b1111110000010000,
-    0b0000000000010001,
-    0b1111010011010000,
-    0b0000000001000010,
-    0b1110001100000011,
-    0b0000000000010010,
-    0b1111110000010000,
-    0b0000000000010000,
-    0b1111000010100000,
-    0b1111110000010000,
-    0b0000000000010011,
-    0b1110001100001000,
-    0b0000000000010000,
-    0b1111110000010000,
-    0b0000000000010100,
-    0b1110001110001000,
-    0b0000000000010100,
-    0b1111110000010000,
-    0b0000000000110011,
-    0b1110001100000100,
-    0b0000000000010010,
-    0b1111110000010000,
-    0b0000000000010100,
-    0b1111000010100000,
-    0b1111110000010000,
-    0b0000000000010101,
-    0b1110001100001000,
-    0b0000000000010011,
-    0b1111010011010000,
-    0b0000000000110011,
-    0b1110001100000001,
-    0b0000000000010010,
-    0b1111110111010000,
-    0b0000000000010100,
-    0b1111000010010000,
-    0b0000000000010110,
-    0b1110001100001000,
-    0b0000000000010101,
-    0b1111110000010000,
-    0b0000000000010110,
-    0b1111110000100000,
-    0b1110001100001000,
-    0b0000000000010100,
-    0b1111110010001000,
-    0b0000000000010101,
-    0b1110101010000111,
-    0b0000000000010010,
-    0b1111110111010000,
-    0b0000000000010100,
-    0b1111000010010000,
-    0b0000000000010110,
-    0b1110001100001000,
-    0b0000000000010011,
-    0b1111110000010000,
-    0b0000000000010110,
-    0b1111110000100000,
-    0b1110001100001000,
-    0b0000000000010000,
-    0b1111110111001000,
-    0b0000000000000100,
-    0b1110101010000111,
-    0b0000000000010111,
-    0b1111110000100000,
-    0b1110101010000111,
-    0b0000000000001110,
-    0b1111110000010000,
-    0b0000000000010010,
-    0b1110001100001000,
-    0b0000000000001111,
-    0b1111110000010000,
-    0b0000000000010001,
-    0b1110001100001000,
-    0b0000000001010011,
-    0b1110110000010000,
-    0b0000000000010111,
-    0b1110001100001000,
-    0b0000000000000010,
-    0b1110101010000111,
-]
-
-# Multiplies RAM[0] and RAM[1] and stores the result in RAM[2].
-MULT = [
-    0b0000000000011101,
-    0b1110101010000111,
-    0b0000000000010000,
-    0b1110101010001000,
-    0b0000000000010001,
-    0b1111110000010000,
-    0b0000000000001110,
-    0b1110001100000011,
-    0b0000000000010010,
-    0b1111110001010000,
-    0b1110011111001000,
-    0b0000000000010001,
-    0b1111110001010000,
-    0b1110011111001000,
-    0b0000000000010001,
-    0b1111110000010000,
-    0b0000000000011010,
-    0b1110001100000010,
-    0b0000000000010001,
-    0b1110001110001000,
-    0b0000000000010010,
-    0b1111110000010000,
-    0b0000000000010000,
-    0b1111000010001000,
-    0b0000000000001110,
-    0b1110101010000111,
-    0b0000000000010011,
-    0b1111110000100000,
-    0b1110101010000111,
-    0b0000000000000010,
-    0b1110101010001000,
-    0b0000000000000000,
-    0b1111110000010000,
-    0b0000000000010010,
-    0b1110001100001000,
-    0b0000000000000001,
-    0b1111110000010000,
-    0b0000000000010001,
-    0b1110001100001000,
-    0b0000000000101101,
-    0b1110110000010000,
-    0b0000000000010011,
-    0b1110001100001000,
-    0b0000000000000010,
-    0b1110101010000111,
-    0b0000000000010000,
-    0b1111110000010000,
-    0b0000000000000010,
-    0b1110001100001000,
-]
+# The programs below only access low RAM addresses,
+# so the vectorized model doesn't need all of it
+SCREEN_RAM_WORDS = 64
+
+# Views of the RAM and the ROM, set up on first use by `_memories`
+_memory_views: Optional[Tuple[util.MemoryView, util.MemoryView]] = None
+
+# Programs and inputs of at least this many words are loaded through files
+# rather than word by word
+FILE_LOAD_WORDS = 64
+
+# Where the memory files go
+_memory_files = tempfile.TemporaryDirectory(prefix="cpu_tb_")
+
+# MULT loops once per unit of the multiplier, and SORT takes quadratic time,
+# so their inputs are capped to keep the RTL runs short
+MUL_MAX_MULTIPLIER = 0xFF
+SORT_LENGTH = 32
+
+# The full-size inputs run on the reference model alone, with this budget
+FULL_SIZE_CYCLES = 1_000_000
+
+# Number of instructions in the programs test_random_program generates
+RANDOM_PROGRAM_LENGTH = 256
+
+
+def _load_program(name: str) -> List[int]:
+    return hack_asm.assemble_file(os.path.join(os.path.dirname(__file__), name))
+
+
+def _load_optimized_program(name: str) -> List[int]:
+    with open(os.path.join(os.path.dirname(__file__), name), encoding="ASCII") as f:
+        return hack_asm.assemble(hack_opt.optimize(f.read()).source)
+
+
+ADD = _load_program("add.asm")
+MAX = _load_program("max.asm")
+DIVIDE = _load_program("divide.asm")
+SORT = _load_program("sort.asm")
+MULT = _load_program("mult.asm")
 
 
 @cocotb.test()
 async def test_add(dut: HierarchyObject):
     util.start_clock(dut, CLOCK_HZ)
-    memory = await _execute_program(dut, ADD)
+    memory, _ = await _execute_program(dut, ADD)
     assert memory[0] == 5
 
 
 @cocotb.test()
 async def test_max(dut: HierarchyObject):
-    first = random.randint(0, VAL_MAX)
-    second = random.randint(0, VAL_MAX)
+    firsts = [random.randint(0, VAL_MAX) for _ in range(SCREEN_VECTORS)]
+    seconds = [random.randint(0, VAL_MAX) for _ in range(SCREEN_VECTORS)]
+
+    model = hack_vector.VectorCpu(
+        MAX, memory={0: firsts, 1: seconds}, ram_words=SCREEN_RAM_WORDS
+    )
+    assert model.run_until_halt(1000).all()
+    results = model.ram[:, 2]
+    assert (results == np.maximum(firsts, seconds)).all()
 
     util.start_clock(dut, CLOCK_HZ)
 
-    memory = await _execute_program(dut, MAX, memory={0: first, 1: second})
+    for i in _corner_cases(results):
+        first, second = firsts[i], seconds[i]
+
+        memory, _ = await _execute_program(dut, MAX, memory={0: first, 1: second})
 
-    assert memory[2] == max(first, second)
+        assert memory[2] == max(first, second)
 
 
 @cocotb.test()
 async def test_div(dut: HierarchyObject):
-    first = random.randint(1, VAL_MAX)
-    second = random.randint(1, VAL_MAX)
+    firsts = [random.randint(1, VAL_MAX) for _ in range(SCREEN_VECTORS)]
+    seconds = [random.randint(1, VAL_MAX) for _ in range(SCREEN_VECTORS)]
+
+    model = hack_vector.VectorCpu(
+        DIVIDE, memory={13: firsts, 14: seconds}, ram_words=SCREEN_RAM_WORDS
+    )
+    assert model.run_until_halt(1000).all()
+    results = model.ram[:, 15]
+    assert (results == np.floor_divide(firsts, seconds)).all()
 
     util.start_clock(dut, CLOCK_HZ)
 
-    memory = await _execute_program(dut, DIVIDE, memory={13: first, 14: second})
+    for i in _corner_cases(results):
+        first, second = firsts[i], seconds[i]
+
+        memory, _ = await _execute_program(dut, DIVIDE, memory={13: first, 14: second})
 
-    assert memory[15] == first // second
+        assert memory[15] == first // second
+
+
+@cocotb.test()
+async def test_optimized(dut: HierarchyObject):
+    dividend = random.randint(1, VAL_MAX)
+    divisor = random.randint(1, 0xFF)
+    multiplicand = random.randint(VAL_MIN, VAL_MAX)
+    multiplier = random.randint(-0xFF, 0xFF)
+
+    cases = [
+        (DIVIDE, "divide.asm", {13: dividend, 14: divisor}, 15, dividend // divisor),
+        (
+            MULT,
+            "mult.asm",
+            {0: multiplicand, 1: multiplier},
+            2,
+            ctypes.c_int16(multiplicand * multiplier).value,
+        ),
+    ]
+
+    util.start_clock(dut, CLOCK_HZ)
 
+    for program, name, inputs, output, expected in cases:
+        optimized = _load_optimized_program(name)
+        assert len(optimized) < len(program)
 
-@cocotb.test(skip=True)
+        memory, executed = await _execute_program(dut, optimized, memory=inputs)
+        assert memory[output] == expected
+
+        reference = hack.TranslatingCpu(program, inputs)
+        assert reference.run_until_halt(hack_analysis.cycle_bound(program, inputs))
+        assert executed <= reference.cycles
+
+        dut._log.info(
+            f"{name}: {len(program)} -> {len(optimized)} instructions, "
+            f"{reference.cycles} -> {executed} cycles"
+        )
+
+
+@cocotb.test()
+async def test_optimized_extended(dut: HierarchyObject):
+    source = """
+        @R0
+        D=M
+        M=D+M
+        @R1
+        M=D-M
+        D=M
+        D=D+M
+        @R2
+        M=D
+        (END)
+        @END
+        0;JMP
+    """
+
+    result = hack_opt.optimize(source)
+    assert [rewrite.after for rewrite in result.rewrites] == [("M=M<<",), ("D=M<<",)]
+    assert result.size_after < result.size_before
+
+    x = random.randint(VAL_MIN, VAL_MAX)
+    y = random.randint(VAL_MIN, VAL_MAX)
+
+    util.start_clock(dut, CLOCK_HZ)
+
+    memory, _ = await _execute_program(
+        dut, hack_asm.assemble(result.source), memory={0: x, 1: y}
+    )
+
+    assert memory[0] == ctypes.c_int16(2 * x).value
+    assert memory[1] == ctypes.c_int16(x - y).value
+    assert memory[2] == ctypes.c_int16(2 * (x - y)).value
+
+
+@cocotb.test()
 async def test_mul(dut: HierarchyObject):
+    # The full range is only run on the reference model,
+    # including the longest multiplication
+    for second in [VAL_MAX, random.randint(0, VAL_MAX)]:
+        first = random.randint(0, VAL_MAX)
+        model = hack.TranslatingCpu(MULT, {0: first, 1: second})
+        assert model.run_until_halt(FULL_SIZE_CYCLES)
+        assert model.signed_memory()[2] == ctypes.c_int16(first * second).value
+
     first = random.randint(0, VAL_MAX)
-    second = random.randint(0, VAL_MAX)
+    second = random.randint(0, MUL_MAX_MULTIPLIER)
 
     util.start_clock(dut, CLOCK_HZ)
 
-    memory = await _execute_program(
-        dut, MULT, memory={0: first, 1: second}, cycles=1000000
-    )
+    memory, _ = await _execute_program(dut, MULT, memory={0: first, 1: second})
 
     assert memory[2] == ctypes.c_int16(first * second).value
 
 
-@cocotb.test(skip=True)
+@cocotb.test()
 async def test_sort(dut: HierarchyObject):
+    # The full-size array is only sorted on the reference model
     to_sort = [random.randint(0, VAL_MAX) for _ in range(100)]
 
     memory = {100 + i: value for i, value in enumerate(to_sort)}
     memory[14] = 100
     memory[15] = len(to_sort)
 
+    model = hack.TranslatingCpu(SORT, memory)
+    assert model.run_until_halt(FULL_SIZE_CYCLES)
+    assert model.signed_memory()[100 : 100 + len(to_sort)] == sorted(
+        to_sort, reverse=True
+    )
+
+    to_sort = [random.randint(0, VAL_MAX) for _ in range(SORT_LENGTH)]
+
+    memory = {100 + i: value for i, value in enumerate(to_sort)}
+    memory[14] = 100
+    memory[15] = len(to_sort)
+
     util.start_clock(dut, CLOCK_HZ)
 
-    out_memory = await _execute_program(dut, SORT, memory=memory, cycles=100000)
+    out_memory, _ = await _execute_program(dut, SORT, memory=memory)
 
     output_array = out_memory[100 : 100 + len(to_sort)]
 
     assert output_array == sorted(to_sort, reverse=True)
 
 
+@cocotb.test()
+async def test_sort_ram_dump(dut: HierarchyObject):
+    to_sort = [random.randint(0, VAL_MAX) for _ in range(16)]
+
+    memory = {100 + i: value for i, value in enumerate(to_sort)}
+    memory[14] = 100
+    memory[15] = len(to_sort)
+
+    util.start_clock(dut, CLOCK_HZ)
+
+    out_memory, _ = await _execute_program(dut, SORT, memory=memory)
+
+    assert out_memory[100 : 100 + len(to_sort)] == sorted(to_sort, reverse=True)
+
+    # The program has halted, so all of its writes are visible.
+    # Compare all of RAM, including words the program shouldn't have touched.
+    reference = hack.TranslatingCpu(SORT, memory)
+    assert reference.run_until_halt(hack_analysis.cycle_bound(SORT, memory))
+    expected = reference.signed_memory()
+
+    actual = await _dump_ram(dut)
+
+    assert len(actual) == len(expected)
+    for addr, actual_value in actual.items():
+        assert (
+            actual_value == expected[addr]
+        ), f"RAM[{addr}] is {actual_value}, reference model has {expected[addr]}"
+
+
+@cocotb.test()
+async def test_random_program(dut: HierarchyObject):
+    program = _random_program(RANDOM_PROGRAM_LENGTH)
+
+    util.start_clock(dut, CLOCK_HZ)
+
+    # Compared against the reference model along the way
+    await _execute_program(dut, program)
+
+
 @cocotb.test()
 async def test_builtin_xor(dut: HierarchyObject):
     program = [
@@ -344,20 +293,42 @@ async def test_builtin_xor(dut: HierarchyObject):
 
     util.start_clock(dut, CLOCK_HZ)
 
-    memory = await _execute_program(dut, program, cycles=len(program) + 1)
+    memory, executed = await _execute_program(dut, program)
 
     assert memory[0] == -117
+    assert executed == len(program)
 
 
 async def _execute_program(
     dut: HierarchyObject,
     program: Sequence[int],
-    cycles: int = 1000,
+    cycles: Optional[int] = None,
     memory: Optional[Mapping[int, int]] = None,
-):
+) -> Tuple[util.MemoryView, int]:
+    """
+    Runs a program on the DUT for at most the given number of cycles.
+    By default, that's just enough for the program to halt on the given
+    inputs (see `hack_analysis.cycle_bound`).
+
+    Simulation stops as soon as the PC reaches one of the program's halt
+    addresses (see `hack.halt_addresses`).
+
+    Returns a (signed) view of the resulting RAM contents, and the number of
+    instructions that were executed.
+
+    The program also runs on the reference model, and the CPU outputs are
+    compared against it on every clock, failing at the first mismatch. Every
+    write then has already been checked, so only the words the reference
+    model ends up with are compared, rather than all of RAM.
+    """
+
     if not memory:
         memory = {}
 
+    if cycles is None:
+        # One more clock for the last instruction to become visible
+        cycles = hack_analysis.cycle_bound(program, memory) + 1
+
     # Wait until next clock
     await ClockCycles(dut.clk, 1)
 
@@ -368,16 +339,166 @@ async def _execute_program(
 
     # Release memory reset and initialize
     dut.mem_reset.value = 0
-    for i, instruction in enumerate(program):
-        dut.rom.memory[i].value = instruction
-    for addr, value in memory.items():
-        dut.ram.memory[addr].value = value
+    ram, rom = await _memories(dut)
+    if len(program) + len(memory) >= FILE_LOAD_WORDS:
+        _load_file(dut, "rom", program)
+        if memory:
+            _load_file(dut, "ram", memory)
+    else:
+        rom.write(0, program)
+        ram.update(memory)
     await ClockCycles(dut.clk, 1)
 
     # Release CPU reset
     dut.cpu_reset.value = 0
 
-    # Execute program for the given number of cycles
-    await ClockCycles(dut.clk, cycles)
+    reference = hack.TranslatingCpu(program, memory)
+
+    executed = await _run(dut, reference, cycles)
+
+    expected = reference.signed_memory()
+    addresses = [addr for addr, value in enumerate(expected) if value]
+    actual = ram.read(addresses)
+
+    for addr, actual_value in actual.items():
+        assert (
+            actual_value == expected[addr]
+        ), f"RAM[{addr}] is {actual_value}, reference model has {expected[addr]}"
+
+    return ram, executed
+
+
+async def _memories(dut: HierarchyObject) -> Tuple[util.MemoryView, util.MemoryView]:
+    """
+    Returns views of the RAM (signed) and of the ROM.
+
+    The first call finds out the orientation of the arrays, from what the
+    CPU reads at address 0. Both memories should have just been reset,
+    along with the CPU.
+    """
+
+    global _memory_views
+
+    if _memory_views is None:
+        ram = util.MemoryView(dut.ram.memory, signed=True)
+        rom = util.MemoryView(dut.rom.memory)
+
+        # Let the resets settle first
+        await FallingEdge(dut.clk)
+        await ram.detect_orientation(dut.cpu_memory_in, FallingEdge(dut.clk))
+        await rom.detect_orientation(dut.instruction, FallingEdge(dut.clk))
+
+        _memory_views = ram, rom
 
-    return [ctypes.c_int16(obj.value.integer).value for obj in dut.ram.memory]
+    return _memory_views
+
+
+def _load_file(
+    dut: HierarchyObject,
+    memory: str,
+    words: Union[Mapping[int, int], Sequence[int]],
+):
+    """
+    Loads words into the "rom" or "ram" of the testbench through a file,
+    within the current time step.
+    """
+    path = os.path.join(_memory_files.name, f"{memory}.hex")
+    util.write_hex(path, words, 16)
+    util.access_file(
+        getattr(dut, f"{memory}_hex"), getattr(dut, f"load_{memory}"), path
+    )
+
+
+async def _dump_ram(dut: HierarchyObject) -> Dict[int, int]:
+    """
+    Returns the whole RAM (signed), read through a file.
+
+    This returns in the read-only phase of the current time step.
+    """
+    path = os.path.join(_memory_files.name, "ram_dump.hex")
+    util.access_file(dut.ram_dump, dut.dump_ram, path)
+    await ReadOnly()
+    return {
+        address: ctypes.c_int16(word).value
+        for address, word in util.read_hex(path).items()
+    }
+
+
+async def _run(
+    dut: HierarchyObject,
+    reference: hack.Cpu,
+    cycles: int,
+) -> int:
+    """
+    Lets the CPU run for at most `cycles` clocks, stopping early once the PC
+    reaches one of the reference model's halt addresses.
+
+    The PC is sampled in the middle of every clock. The reference model
+    is stepped along with the DUT, and all CPU outputs are compared
+    against it.
+
+    Returns the number of instructions executed. If the budget runs out,
+    this returns right after the last clock edge, before it takes effect,
+    so only (cycles - 1) instructions are visible.
+    """
+
+    for cycle in range(cycles):
+        if cycle:
+            reference.step()
+
+        await FallingEdge(dut.clk)
+
+        pc = dut.next_instruction_addr.value.integer
+
+        expected = reference.outputs()
+        actual = hack.CpuOutputs(
+            next_instruction_addr=pc,
+            memory_addr=dut.memory_addr.value.integer,
+            memory_we=bool(dut.memory_we.value.integer),
+            memory_out=dut.cpu_memory_out.value.integer,
+        )
+
+        assert actual == expected, (
+            f"Mismatch with reference model at cycle {cycle}, "
+            f"PC 0x{reference.pc:04X}: {actual} != {expected}"
+        )
+
+        if pc in reference.halts:
+            return cycle
+
+    await RisingEdge(dut.clk)
+
+    return cycles - 1
+
+
+def _random_program(length: int) -> Sequence[int]:
+    """
+    Generates a program of random instructions, which only ever jumps
+    to its end, where it halts.
+    """
+
+    computations = list(hack_asm.COMP)
+    destinations = list(hack_asm.DEST)
+    jumps = [jump for jump in hack_asm.JUMP if jump]
+
+    builder = hack_asm.ProgramBuilder()
+    while len(builder) < length:
+        kind = random.random()
+        if kind < 0.3:
+            builder.a(random.randint(0, hack.ADDRESS_MASK))
+        elif kind < 0.9 or len(builder) > length - 2:
+            builder.c(random.choice(destinations), random.choice(computations))
+        else:
+            builder.a(length).c("", random.choice(computations), random.choice(jumps))
+    return builder.program
+
+
+def _corner_cases(results: np.ndarray) -> List[int]:
+    """
+    Picks the input vectors worth simulating out of those checked on the
+    vectorized model: the ones producing the smallest and largest results,
+    and a random one.
+    """
+    return sorted(
+        {int(results.argmin()), int(results.argmax()), random.randrange(len(results))}
+    )
@@ -1,8 +1,10 @@
+import os.path
 import random
+import tempfile
 
 import cocotb
 from cocotb.handle import HierarchyObject
-from cocotb.triggers import ClockCycles, Timer
+from cocotb.triggers import ClockCycles, ReadOnly, Timer
 
 import util
 
@@ -45,6 +47,37 @@ async def test_ram_read_write(dut: HierarchyObject):
         assert dut.data_o.value.integer == value
 
 
+@cocotb.test()
+async def test_ram_file_load_dump(dut: HierarchyObject):
+    util.start_clock(dut, CLOCK_HZ)
+    await _reset(dut, 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        load_path = os.path.join(directory, "load.hex")
+        dump_path = os.path.join(directory, "dump.hex")
+
+        # Only some of the words, the rest should stay 0
+        words = {
+            address: random.randint(0, (1 << WORD_WIDTH) - 1)
+            for address in random.sample(range(WORDS), WORDS // 4)
+        }
+        util.write_hex(load_path, words, WORD_WIDTH)
+        util.access_file(dut.ram_hex, dut.load_ram, load_path)
+
+        # Spot-check through the read port, including some loaded words
+        addresses = random.sample(range(WORDS), min(WORDS, 64)) + list(words)[:8]
+        for i in sorted(addresses):
+            dut.address_i.value = i
+            await Timer(1, units="step")
+            assert dut.data_o.value.integer == words.get(i, 0)
+
+        util.access_file(dut.ram_dump, dut.dump_ram, dump_path)
+        await ReadOnly()
+
+        dumped = util.read_hex(dump_path)
+        assert dumped == {address: words.get(address, 0) for address in range(WORDS)}
+
+
 async def _reset(dut: HierarchyObject, cycles: int):
     dut.wr_en_i.value = 0
 
@@ -3,7 +3,11 @@
 
 module uart_tb (
     input           reset,
+`ifdef HDL_CLOCK
+    output reg      clk,
+`else
     input           clk,
+`endif
     // Receiver half
     input           rx_i,
     output [7:0]    rx_data_o,
@@ -28,6 +32,11 @@ module uart_tb (
         #1;
     end
 
+`ifdef HDL_CLOCK
+`define HDL_CLOCK_DEFAULT_HZ CLOCK_HZ
+`include "hdl_clock.vh"
+`endif
+
     wire [7:0] rx_data;
     wire       rx_ready;
     wire       rx_ack;
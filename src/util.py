@@ -1,9 +1,15 @@
+import functools
+import itertools
 import random
+import re
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
 
 import cocotb
 from cocotb.clock import Clock
-from cocotb.handle import HierarchyObject, ModifiableObject
-from cocotb.triggers import Timer
+from cocotb.handle import HierarchyObject, ModifiableObject, SimHandleBase
+from cocotb.queue import Queue
+from cocotb.triggers import FallingEdge, First, RisingEdge, Timer, Trigger
+from cocotb.utils import get_sim_time
 
 
 def randbytes(count: int) -> bytes:
@@ -17,17 +23,191 @@ def start_clock(dut: HierarchyObject, clock_hz: int):
     """
     Starts a clock on an input called `clk` of the given DUT,
     with a frequency of `clock_hz`.
+
+    If the testbench generates the clock itself (`HDL_CLOCK`), this only
+    checks that its period is the expected one.
     """
+
+    if "HDL_CLOCK" in cocotb.plusargs:
+        cocotb.start_soon(_check_clock(dut.clk, clock_hz))
+        return
+
+    # hdl_clock.vh rounds the period the same way
     clock = Clock(dut.clk, round(1e9 / clock_hz), units="ns")
     cocotb.start_soon(clock.start())
 
 
+async def _check_clock(clk: SimHandleBase, clock_hz: int):
+    edge = RisingEdge(clk)
+
+    await edge
+    start = get_sim_time("ps")
+    await edge
+    period = get_sim_time("ps") - start
+
+    expected = round(1e9 / clock_hz) * 1000
+    assert period == expected, (
+        f"Testbench clock period is {period} ps, expected {expected} ps "
+        f"({clock_hz} Hz)"
+    )
+
+
+class UartSource:
+    """
+    Drives 8N1 UART frames into an input, with the given `baud` rate.
+
+    Each frame is sent as runs of equal bits, with one wait per run rather
+    than per bit, and the waits are created once up front. A source sends
+    one thing at a time, so don't share it between concurrent coroutines.
+    """
+
+    def __init__(self, rx: ModifiableObject, baud: int):
+        self._rx = rx
+        self.baud = baud
+
+        # A frame has at most 10 equal bits in a row (with an invalid stop bit)
+        bit_ns = round(1e9 / baud)
+        self._timers = {bits: Timer(bits * bit_ns, "ns") for bits in range(1, 11)}
+
+    async def send(
+        self, data: Union[bytes, bytearray, memoryview], invalid_stop: bool = False
+    ):
+        """
+        Sends a sequence of bytes. Takes anything that supports the buffer
+        protocol, without copying it.
+
+        If `invalid_stop` is `True`, will generate invalid stop bits (0).
+        """
+
+        rx = self._rx
+        timers = self._timers
+        for byte in memoryview(data).cast("B"):
+            for value, bits in _frame_runs(byte, invalid_stop):
+                rx.value = value
+                await timers[bits]
+
+    async def send_byte(self, byte: int, invalid_stop: bool = False):
+        """
+        Sends a single byte.
+
+        If `invalid_stop` is `True`, will generate an invalid stop bit (0).
+        """
+
+        assert 0 <= byte <= 0xFF
+
+        for value, bits in _frame_runs(byte, invalid_stop):
+            self._rx.value = value
+            await self._timers[bits]
+
+
+class UartSink:
+    """
+    Decodes 8N1 UART frames from an output, with the given `baud` rate,
+    in the background.
+
+    Each bit is sampled in its middle, timed from the falling edge that
+    starts the frame. Received bytes are appended to `data`, and can also
+    be awaited one at a time with `receive`. Frames with a start bit that
+    doesn't hold, or with an invalid stop bit, are dropped and counted in
+    `framing_errors`.
+    """
+
+    def __init__(self, tx: SimHandleBase, baud: int):
+        self._tx = tx
+        self.baud = baud
+
+        bit_ns = round(1e9 / baud)
+        self._half_bit = Timer(bit_ns // 2, "ns")
+        self._bit = Timer(bit_ns, "ns")
+
+        self.data = bytearray()
+        self.frames = 0
+        self.framing_errors = 0
+
+        self._queue: Queue[int] = Queue()
+        self._task = None
+        self._first_start: Optional[float] = None
+        self._last_stop: Optional[float] = None
+
+    def start(self) -> "UartSink":
+        """
+        Starts decoding. The line should be idle (high) at this point.
+        """
+        assert self._task is None
+        self._task = cocotb.start_soon(self._run())
+        return self
+
+    def stop(self):
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+
+    async def receive(self) -> int:
+        """
+        Waits for the next byte, and returns it.
+        """
+        return await self._queue.get()
+
+    @property
+    def bytes_per_second(self) -> float:
+        """
+        Received bytes per second of simulated time, from the start of the
+        first frame to the end of the last one.
+        """
+        if self._first_start is None or self._last_stop is None:
+            return 0.0
+        return len(self.data) / (self._last_stop - self._first_start)
+
+    async def _run(self):
+        tx = self._tx
+        start = FallingEdge(tx)
+
+        while True:
+            await start
+            if self._first_start is None:
+                self._first_start = get_sim_time("sec")
+
+            await self._half_bit
+            if tx.value.integer:
+                self.framing_errors += 1
+                continue
+
+            byte = 0
+            for bit in range(8):
+                await self._bit
+                byte |= tx.value.integer << bit
+
+            await self._bit
+            self.frames += 1
+            if not tx.value.integer:
+                self.framing_errors += 1
+                continue
+
+            # The frame is over once the stop bit is
+            self._last_stop = get_sim_time("sec") + 0.5 / self.baud
+
+            self.data.append(byte)
+            self._queue.put_nowait(byte)
+
+
+@functools.lru_cache(maxsize=None)
+def _frame_runs(byte: int, invalid_stop: bool) -> Tuple[Tuple[int, int], ...]:
+    """
+    Returns the levels of an 8N1 frame, as (value, bit count) pairs.
+    """
+
+    levels = [0] + [(byte >> bit) & 1 for bit in range(8)] + [int(not invalid_stop)]
+
+    return tuple(
+        (value, len(list(group))) for value, group in itertools.groupby(levels)
+    )
+
+
 async def uart_send(rx: ModifiableObject, baud: int, data: bytes):
     """
     Sends a sequence of bytes using 8N1 UART, with the given `baud` rate.
     """
-    for byte in data:
-        await uart_send_byte(rx, baud, byte)
+    await UartSource(rx, baud).send(data)
 
 
 async def uart_send_byte(
@@ -38,24 +218,31 @@ async def uart_send_byte(
 
     If `invalid_stop` is `True`, will generate an invalid stop bit (0).
     """
+    await UartSource(rx, baud).send_byte(byte, invalid_stop)
+
+
+async def wait_until(
+    signal: SimHandleBase, value: int, error: Optional[SimHandleBase] = None
+):
+    """
+    Waits until the single-bit `signal` has the given value.
 
-    assert 0 <= byte <= 0xFF
+    This wakes up only on the signal's edges, rather than on every clock.
+    If `error` is given, it must stay low throughout, and the wait fails as
+    soon as it rises.
+    """
 
-    # Start bit
-    rx.value = 0
-    await bit_time(baud)
+    edge = RisingEdge(signal) if value else FallingEdge(signal)
+    triggers = edge if error is None else First(edge, RisingEdge(error))
 
-    # Data bits
-    for bit in range(8):
-        rx.value = (byte >> bit) & 1
-        await bit_time(baud)
+    while True:
+        if error is not None:
+            assert not error.value.integer, f"{error._name} is set"
 
-    # Stop bit
-    if invalid_stop:
-        rx.value = 0
-    else:
-        rx.value = 1
-    await bit_time(baud)
+        if signal.value.integer == value:
+            return
+
+        await triggers
 
 
 async def bit_time(baud: int):
@@ -63,3 +250,199 @@ async def bit_time(baud: int):
     Waits for a single bit time for with given baud rate.
     """
     await Timer(round(1e9 / baud), "ns")
+
+
+class MemoryView:
+    """
+    Word access by address to a memory array in the simulation,
+    such as `dut.ram.memory`.
+
+    Handles to the words are only looked up when first accessed, and then
+    kept. Slices read and write just the addresses they cover, and `read`
+    and `update` access any set of addresses, so a test only pays for the
+    words it actually looks at.
+
+    If `signed` is set, words are read as two's complement.
+    """
+
+    def __init__(self, array: SimHandleBase, signed: bool = False):
+        self._array = array
+        self._size = len(array)
+        self._handles: List[Optional[SimHandleBase]] = [None] * self._size
+        self._width: Optional[int] = None
+        self.signed = signed
+
+        # Whether index 0 of the array handle is the highest address
+        self.reversed = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[int, List[int]]:
+        if isinstance(key, slice):
+            return [self._read(address) for address in range(*key.indices(self._size))]
+        return self._read(self._address(key))
+
+    def __setitem__(self, key: Union[int, slice], value):
+        if isinstance(key, slice):
+            addresses = range(*key.indices(self._size))
+            values = list(value)
+            if len(values) != len(addresses):
+                raise ValueError(
+                    f"Can't assign {len(values)} words to {len(addresses)} addresses"
+                )
+            for address, word in zip(addresses, values):
+                self._write(address, word)
+        else:
+            self._write(self._address(key), value)
+
+    def read(self, addresses: Iterable[int]) -> Dict[int, int]:
+        """
+        Reads the given addresses, in any order.
+        """
+        return {address: self._read(self._address(address)) for address in addresses}
+
+    def write(self, start: int, words: Iterable[int]):
+        """
+        Writes consecutive words, from the given address on.
+        """
+        for address, word in enumerate(words, start=self._address(start)):
+            self._write(self._address(address), word)
+
+    def update(self, words: Mapping[int, int]):
+        """
+        Writes the given words, by address.
+        """
+        for address, word in words.items():
+            self._write(self._address(address), word)
+
+    async def detect_orientation(self, output: SimHandleBase, settle: Trigger):
+        """
+        Finds out which end of the array handle is address 0, given an
+        `output` of the memory that currently shows the word at address 0.
+
+        This marks both ends of the array, waits for `settle`, and sees
+        which mark shows up on the output. Both words are restored
+        afterwards.
+        """
+
+        last = self._size - 1
+        self.reversed = False
+        if last == 0:
+            return
+
+        first_handle = self._array[0]
+        last_handle = self._array[last]
+        first_word = first_handle.value
+        last_word = last_handle.value
+
+        first_handle.value = 1
+        last_handle.value = 2
+        await settle
+
+        marker = output.value.integer
+        if marker not in (1, 2):
+            raise RuntimeError(f"Unexpected value {marker} at address 0 of memory")
+        self.reversed = marker == 2
+        self._handles = [None] * self._size
+
+        first_handle.value = first_word
+        last_handle.value = last_word
+
+    def _address(self, address: int) -> int:
+        if address < 0:
+            address += self._size
+        if not 0 <= address < self._size:
+            raise IndexError(f"Address {address} is out of range")
+        return address
+
+    def _handle(self, address: int) -> SimHandleBase:
+        handle = self._handles[address]
+        if handle is None:
+            index = self._size - 1 - address if self.reversed else address
+            handle = self._handles[address] = self._array[index]
+        return handle
+
+    def _read(self, address: int) -> int:
+        value = self._handle(address).value
+        if self.signed:
+            return value.signed_integer
+        return value.integer
+
+    def _write(self, address: int, word: int):
+        handle = self._handle(address)
+        if self._width is None:
+            self._width = handle.value.n_bits
+        handle.value = word & ((1 << self._width) - 1)
+
+
+def write_hex(path: str, words: Union[Mapping[int, int], Sequence[int]], width: int):
+    """
+    Writes words to a file in the format `$readmemh` expects.
+
+    `words` maps addresses to words, or is a sequence of words from address 0.
+    Only the given addresses are written, each run of consecutive ones
+    starting with an `@address` line, so loading the file leaves all
+    the other words alone.
+    """
+
+    if not isinstance(words, Mapping):
+        words = dict(enumerate(words))
+
+    mask = (1 << width) - 1
+    digits = (width + 3) // 4
+
+    lines = []
+    previous = None
+    for address in sorted(words):
+        if previous is None or address != previous + 1:
+            lines.append(f"@{address:X}")
+        lines.append(f"{words[address] & mask:0{digits}X}")
+        previous = address
+
+    with open(path, mode="w", encoding="ASCII") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read_hex(path: str) -> Dict[int, int]:
+    """
+    Reads a file in the format `$writememh` produces,
+    and returns its words by address.
+
+    Raises `ValueError` if any of the words isn't fully known.
+    """
+
+    with open(path, mode="r", encoding="ASCII") as f:
+        text = f.read()
+
+    words = {}
+    address = 0
+    for token in re.sub(r"//[^\n]*|/\*.*?\*/", " ", text, flags=re.S).split():
+        if token.startswith("@"):
+            address = int(token[1:], 16)
+            continue
+
+        try:
+            words[address] = int(token.replace("_", ""), 16)
+        except ValueError:
+            raise ValueError(f"Word {address:#x} in {path} is {token}") from None
+        address += 1
+
+    return words
+
+
+def access_file(name: ModifiableObject, trigger: ModifiableObject, path: str):
+    """
+    Makes a testbench read or write a memory file: deposits the path into
+    the `name` string register, and toggles the `trigger` register that
+    tells the testbench to access the file.
+
+    The access happens within the current time step.
+    """
+
+    encoded = path.encode("ASCII")
+    if len(encoded) * 8 > name.value.n_bits:
+        raise ValueError(f"Path is too long for {name._path}: {path}")
+
+    name.value = int.from_bytes(encoded, "big")
+    trigger.value = not trigger.value.integer